@@ -0,0 +1,439 @@
+# Micro benchmarks of the attila bot
+# ---
+# usage: python bench/bench.py [BENCHMARK ...] [--obs FILE]
+#
+# Without '--obs' the benchmarks run on synthetic observations of a 32x32 map.
+# FILE is a recorded observation: the engine input of a bot (what main.py
+# reads from stdin), one update per line, each turn terminated by D_DONE.
+#
+# Kept out of the bot folder: submit.sh archives everything in it.
+
+import io
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from statistics import mean, median
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bots", "attila")
+sys.path.insert(0, BOT_DIR)
+
+from lux.game import Game
+from lux.array_map import ArrayGameMap
+from lux.game_map import Position
+from lux.pathfinding import get_path_finder, DistanceTable
+from main import TurnReader, write_turn
+
+RESOURCES = ["wood", "coal", "uranium"]
+
+
+###############################################################################
+# OBSERVATIONS
+###############################################################################
+def make_observations(width=32, height=32, turns=360, seed=0, player=0):
+    """
+    Synthetic observations: resource clusters that deplete and regrow, units
+    walking to resources and harvesting, cities growing where units build.
+    Returns a list of turns, each one a list of update lines.
+    """
+    rnd = random.Random(seed)
+    resources = {}
+    for r_type, clusters, size, amount in [("wood", 14, 16, 500), ("coal", 3, 6, 400), ("uranium", 2, 4, 300)]:
+        for _ in range(clusters):
+            cx, cy = rnd.randrange(width), rnd.randrange(height)
+            for _ in range(size):
+                x = min(width - 1, max(0, cx + rnd.randint(-2, 2)))
+                y = min(height - 1, max(0, cy + rnd.randint(-2, 2)))
+                resources[x, y] = [r_type, amount]
+    free = [(x, y) for x in range(width) for y in range(height) if (x, y) not in resources]
+    cities = {0: {"c_1": [rnd.choice(free)]}, 1: {"c_2": [rnd.choice(free)]}}
+    n_city = 2
+    units = {}
+    n_unit = 0
+    research_points = [0, 0]
+    observations = []
+    for turn in range(turns):
+        citytiles = {p for team in cities for tiles in cities[team].values() for p in tiles}
+        for team in (0, 1):
+            tiles = [p for tiles in cities[team].values() for p in tiles]
+            if sum(1 for u in units.values() if u[0] == team) < len(tiles) and rnd.random() < 0.3:
+                n_unit += 1
+                x, y = rnd.choice(tiles)
+                units[f"u_{n_unit}"] = [team, x, y, 0, 0, 0, 0]
+        for unit_id, u in list(units.items()):
+            team, x, y, cooldown = u[:4]
+            if cooldown >= 1:
+                u[3] = cooldown - 1
+                continue
+            if sum(u[4:]) < 100 and resources and rnd.random() < 0.7:
+                # walk towards the closest resource
+                rx, ry = min(resources, key=lambda p: abs(p[0] - x) + abs(p[1] - y))
+                dx, dy = (rx > x) - (rx < x), 0
+                if not dx:
+                    dy = (ry > y) - (ry < y)
+            else:
+                dx, dy = rnd.choice([(1, 0), (-1, 0), (0, 1), (0, -1), (0, 0)])
+            if 0 <= x + dx < width and 0 <= y + dy < height:
+                u[1], u[2] = x + dx, y + dy
+                u[3] = 2 if dx or dy else 0
+            pos = (u[1], u[2])
+            resource = resources.get(pos)
+            if resource and sum(u[4:]) < 100:
+                amount = min(20, resource[1])
+                resource[1] -= amount
+                u[4 + RESOURCES.index(resource[0])] += amount
+                if resource[1] <= 0:
+                    del resources[pos]
+            if sum(u[4:]) >= 100 and pos not in resources and pos not in citytiles and rnd.random() < 0.1:
+                near = [city_id for city_id, tiles in cities[team].items()
+                        if any(abs(px - pos[0]) + abs(py - pos[1]) == 1 for px, py in tiles)]
+                if near:
+                    cities[team][near[0]].append(pos)
+                else:
+                    n_city += 1
+                    cities[team][f"c_{n_city}"] = [pos]
+                citytiles.add(pos)
+                u[4:] = [0, 0, 0]
+            if turn % 40 >= 30 and rnd.random() < 0.02:
+                del units[unit_id]
+        for resource in resources.values():
+            if resource[0] == "wood" and resource[1] < 500:
+                resource[1] = min(500, int(resource[1] * 1.025) + 1)
+        updates = []
+        if turn == 0:
+            updates += [str(player), f"{width} {height}"]
+        for team in (0, 1):
+            research_points[team] += sum(len(tiles) for tiles in cities[team].values())
+            updates.append(f"rp {team} {research_points[team]}")
+        for (x, y), (r_type, amount) in sorted(resources.items(), key=lambda i: (i[0][1], i[0][0])):
+            updates.append(f"r {r_type} {x} {y} {amount}")
+        for unit_id, (team, x, y, cooldown, wood, coal, uranium) in units.items():
+            updates.append(f"u 0 {team} {unit_id} {x} {y} {cooldown} {wood} {coal} {uranium}")
+        for team in (0, 1):
+            for city_id, tiles in cities[team].items():
+                updates.append(f"c {team} {city_id} {rnd.randint(0, 500)} {23 * len(tiles)}")
+        for team in (0, 1):
+            for city_id, tiles in cities[team].items():
+                for x, y in tiles:
+                    updates.append(f"ct {team} {city_id} {x} {y} {rnd.choice([0, 0, 5])}")
+        for x, y in sorted(citytiles):
+            updates.append(f"ccd {x} {y} 6")
+        updates.append("D_DONE")
+        observations.append(updates)
+    return observations
+
+
+def load_observations(path):
+    """ Recorded observations, same format of make_observations """
+    observations = [[]]
+    with open(path) as f:
+        for line in f:
+            observations[-1].append(line.rstrip("\n"))
+            if line.startswith("D_DONE"):
+                observations.append([])
+    return [o for o in observations if o]
+
+
+def report(name, times, unit="ms"):
+    scale = {"ms": 1e3, "us": 1e6}[unit]
+    times = sorted(times)
+    p95 = times[int(len(times) * 0.95)]
+    print(f"  {name:28s} mean {mean(times) * scale:8.3f} {unit}   "
+          f"median {median(times) * scale:8.3f} {unit}   p95 {p95 * scale:8.3f} {unit}")
+
+
+###############################################################################
+# BENCHMARKS
+###############################################################################
+def replay(game, observations, first_step=0):
+    """ Feed the observations to game, returns the time of each turn """
+    times = []
+    for step, updates in enumerate(observations, first_step):
+        t = time.perf_counter()
+        if step == 0:
+            game._initialize(updates)
+            game._update(updates[2:])
+        else:
+            game._update(updates)
+        times.append(time.perf_counter() - t)
+    return times
+
+
+def best_of(repeat, run):
+    """ Per turn minimum time of 'repeat' runs """
+    return [min(t) for t in zip(*[run() for _ in range(repeat)])]
+
+
+def bench_parse(observations, repeat=5):
+    """ Per turn cost of Game._update """
+    lines = [len(o) for o in observations]
+    print(f"parse: {len(observations)} turns, {mean(lines):.0f} lines per turn (max {max(lines)})")
+    for name, kwargs in [("GameMap", {}),
+                         ("GameMap incremental", {"incremental": True}),
+                         ("ArrayGameMap incremental", {"incremental": True, "map_class": ArrayGameMap})]:
+        report(name, best_of(repeat, lambda: replay(Game(**kwargs), observations)))
+
+
+def bench_memory(observations, repeat=5):
+    """ Memory held by the game state, allocations and time of each turn """
+    print(f"memory: {len(observations)} turns")
+    for name, kwargs in [("GameMap", {}),
+                         ("GameMap incremental", {"incremental": True}),
+                         ("ArrayGameMap incremental", {"incremental": True, "map_class": ArrayGameMap})]:
+        # memory allocated by each turn (peak of the turn)
+        game = Game(**kwargs)
+        peaks = []
+        for step, updates in enumerate(observations):
+            tracemalloc.start()
+            replay(game, [updates], step)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        # memory held by the game state at the end of the game
+        tracemalloc.start()
+        game = Game(**kwargs)
+        replay(game, observations)
+        resident = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        times = best_of(repeat, lambda: replay(Game(**kwargs), observations))
+        print(f"  {name:28s} resident {resident / 1024:7.1f} KiB   "
+              f"turn peak {mean(peaks) / 1024:7.1f} KiB   time {mean(times) * 1e3:6.3f} ms/turn")
+
+
+def bench_io(observations, repeat=5):
+    """ Per turn latency of the engine protocol on a pipe """
+    print(f"io: {len(observations)} turns")
+    blocks = [("\n".join(updates) + "\n").encode() for updates in observations]
+    actions = [f"m u_{i} n" for i in range(40)]
+
+    def read_lines(stream):
+        # line by line with input(), as the kit main.py
+        stdin = sys.stdin
+        sys.stdin = stream
+        try:
+            lines = []
+            while True:
+                lines.append(input())
+                if lines[-1] == "D_DONE":
+                    return lines
+        finally:
+            sys.stdin = stdin
+
+    def read_block(reader):
+        return reader.read_turn()
+
+    def write_prints(stream):
+        # two print calls, as the kit main.py
+        stdout = sys.stdout
+        sys.stdout = stream
+        try:
+            print(",".join(actions))
+            print("D_FINISH")
+        finally:
+            sys.stdout = stdout
+
+    def run(read, write, make_reader):
+        r_in, w_in = os.pipe()
+        r_out, w_out = os.pipe()
+        stream = os.fdopen(r_in, "rb")
+        reader = make_reader(stream)
+        writer = io.TextIOWrapper(os.fdopen(w_out, "wb"), line_buffering=True)
+        times = []
+        for block in blocks:
+            os.write(w_in, block)
+            t = time.perf_counter()
+            read(reader)
+            write(writer)
+            times.append(time.perf_counter() - t)
+            os.read(r_out, 1 << 16)
+        os.close(w_in)
+        writer.close()
+        stream.close()
+        os.close(r_out)
+        return times
+
+    report("input() + 2 x print", best_of(repeat, lambda: run(read_lines, write_prints, io.TextIOWrapper)), "us")
+    report("TurnReader + write_turn", best_of(repeat, lambda: run(read_block, lambda w: write_turn(w, actions),
+                                                               TurnReader)), "us")
+
+
+def bench_snapshot(observations, repeat=5, copies=100):
+    """ Cost of Game.snapshot, compared with the parsing of the same turn """
+    print(f"snapshot: {len(observations)} turns, {copies} snapshots per turn")
+    for name, kwargs in [("GameMap", {"incremental": True}),
+                         ("ArrayGameMap", {"incremental": True, "map_class": ArrayGameMap})]:
+        game = Game(**kwargs)
+        times = []
+        for step, updates in enumerate(observations):
+            replay(game, [updates], step)
+            t = time.perf_counter()
+            for _ in range(copies):
+                game.snapshot()
+            times.append((time.perf_counter() - t) / copies)
+        report(name + " snapshot", times, "us")
+        report(name + " parse", best_of(repeat, lambda: replay(Game(**kwargs), observations)), "us")
+
+
+def bench_path(observations, repeat=5, queries=200):
+    """
+    Cost of Position.path_to on the last turn: between random cells and
+    from random cells to a few shared targets (see lux.pathfinding)
+    """
+    print(f"path: {queries} queries on turn {len(observations) - 1}")
+    rnd = random.Random(0)
+    for name, kwargs in [("GameMap", {"incremental": True}),
+                         ("ArrayGameMap", {"incremental": True, "map_class": ArrayGameMap})]:
+        game = Game(**kwargs)
+        replay(game, observations)
+        w, h = game.map.width, game.map.height
+        cells = [Position.at(rnd.randrange(w), rnd.randrange(h)) for _ in range(queries)]
+        targets = [Position.at(rnd.randrange(w), rnd.randrange(h)) for _ in range(8)]
+        finder = get_path_finder(w, h)
+        for label, pairs in [("random", list(zip(cells, cells[1:] + cells[:1]))),
+                             ("8 targets", [(cell, rnd.choice(targets)) for cell in cells])]:
+            hits, misses = finder.hits, finder.misses
+            times = [math.inf] * len(pairs)
+            for _ in range(repeat):
+                game.map._clear_search_cache()
+                for i, (start, target) in enumerate(pairs):
+                    t = time.perf_counter()
+                    start.path_to(target, game.map, playerid=game.id)
+                    times[i] = min(times[i], time.perf_counter() - t)
+            report(f"{name} {label}", times, "us")
+            hits, misses = finder.hits - hits, finder.misses - misses
+            print(f"  {'':28s} cache hit rate {hits / (hits + misses):.0%}")
+
+
+def bench_astar(observations, repeat=5, queries=200, min_distance=16):
+    """
+    Flood (uncached path_to) against A* (path_to with astar) on long paths,
+    every 40 turns: cells expanded and time per query
+    """
+    print(f"astar: {queries} queries longer than {min_distance} every 40 turns")
+    rnd = random.Random(0)
+    game = Game(incremental=True, map_class=ArrayGameMap)
+    per_turn = max(1, queries * 40 // len(observations))
+    results = {"flood": ([], []), "A*": ([], [])}
+    for step, updates in enumerate(observations):
+        replay(game, [updates], step)
+        if step % 40:
+            continue
+        w, h = game.map.width, game.map.height
+        finder = get_path_finder(w, h)
+        pairs = []
+        while len(pairs) < per_turn:
+            start = Position.at(rnd.randrange(w), rnd.randrange(h))
+            target = Position.at(rnd.randrange(w), rnd.randrange(h))
+            if start.distance_to(target) >= min_distance:
+                pairs.append((start, target))
+        for name, astar in [("flood", False), ("A*", True)]:
+            expanded, times = results[name]
+            for start, target in pairs:
+                best = math.inf
+                for _ in range(repeat):
+                    game.map._field_cache = {}
+                    n = finder.expanded
+                    t = time.perf_counter()
+                    start.path_to(target, game.map, playerid=game.id, astar=astar)
+                    best = min(best, time.perf_counter() - t)
+                expanded.append(finder.expanded - n)
+                times.append(best)
+    for name, (expanded, times) in results.items():
+        report(name, times, "us")
+        print(f"  {'':28s} cells expanded: mean {mean(expanded):.0f}   median {median(expanded):.0f}")
+
+
+def bench_batch(observations, repeat=5):
+    """
+    Paths of all the units to their closest citytile every 10 turns:
+    one path_to for each unit against one GameMap.plan_paths
+    """
+    game = Game(incremental=True, map_class=ArrayGameMap)
+    loop, batch, searches, n_requests = [], [], [], []
+    for step, updates in enumerate(observations):
+        replay(game, [updates], step)
+        if step % 10:
+            continue
+        requests = []
+        for player in game.players:
+            tiles = [ct.pos for city in player.cities.values() for ct in city.citytiles]
+            for unit in player.units:
+                if tiles:
+                    target = min(tiles, key=unit.pos.distance_to)
+                    requests.append((unit, target, {"playerid": player.team}))
+        if not requests:
+            continue
+        best_loop = best_batch = math.inf
+        for _ in range(repeat):
+            game.map._clear_search_cache()
+            t = time.perf_counter()
+            for unit, target, flags in requests:
+                unit.pos.path_to(target, game.map, **flags)
+            best_loop = min(best_loop, time.perf_counter() - t)
+            game.map._clear_search_cache()
+            result = game.map.plan_paths(requests)
+            best_batch = min(best_batch, result.time)
+        loop.append(best_loop)
+        batch.append(best_batch)
+        searches.append(result.searches)
+        n_requests.append(result.requests)
+    print(f"batch: {len(loop)} turns, {mean(n_requests):.0f} requests per turn")
+    report("path_to loop", loop)
+    report("plan_paths", batch)
+    print(f"  {'':28s} searches per turn: mean {mean(searches):.1f}")
+
+
+def bench_distances(observations, repeat=5, queries=200):
+    """
+    Cost of the distance table (Game distances): turns with parsing only
+    against parsing with the table, and the time of a row of the table
+    """
+    print(f"distances: {len(observations)} turns, {queries} rows every 40 turns")
+    rnd = random.Random(0)
+    for name, kwargs in [("parse", {}), ("parse + table", {"distances": True})]:
+        report(name, best_of(repeat, lambda: replay(Game(incremental=True, map_class=ArrayGameMap, **kwargs),
+                                                    observations)))
+    game = Game(incremental=True, map_class=ArrayGameMap, distances=True)
+    tables = 0
+    times = []
+    table = None
+    for step, updates in enumerate(observations):
+        replay(game, [updates], step)
+        if game.distances is not table:
+            tables += 1
+            table = game.distances
+        if step % 40:
+            continue
+        finder = get_path_finder(game.map.width, game.map.height)
+        for _ in range(queries * 40 // len(observations) or 1):
+            empty = DistanceTable(finder, table.obstacles, build=False)
+            x, y = rnd.randrange(game.map.width), rnd.randrange(game.map.height)
+            t = time.perf_counter()
+            empty.row(x, y)
+            times.append(time.perf_counter() - t)
+    report("row", times, "us")
+    print(f"  {'':28s} tables: {tables} (one for each change of the obstacles)")
+
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "memory": bench_memory,
+    "io": bench_io,
+    "snapshot": bench_snapshot,
+    "path": bench_path,
+    "astar": bench_astar,
+    "distances": bench_distances,
+    "batch": bench_batch,
+}
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if "--obs" in args:
+        i = args.index("--obs")
+        observations = load_observations(args[i + 1])
+        del args[i:i + 2]
+    else:
+        observations = make_observations()
+    for name in args or BENCHMARKS:
+        BENCHMARKS[name](observations)
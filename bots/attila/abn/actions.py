@@ -1,9 +1,14 @@
-from abn.game_ext import GameExtended
+import math
+from abn.game_ext import GameExtended, UNIT_ACTION_COOLDOWN
+from abn.jobs import Job
 from lux.game_objects import Unit, CityTile
 from lux.game_map import Position
 from lux.constants import Constants
+from lux.pathfinding import get_path_finder, UNREACHED
 
 DEBUG_ONLY_PLAYER_0 = True
+HORIZON = 4     # moves or waits planned ahead by move_to
+
 class Actions:
 
     def __init__(self, game_state: GameExtended):
@@ -11,17 +16,42 @@ class Actions:
         self.actions = [] 
         self.next_pos = {}  # Dictionary (unit.id: pos)
         self.req_pos = {}   # last requested position
-        self.collision = []
+        self.collision = set()
         self.new_workers = 0 
+        self._next_cells = {}   # number of units for each position in next_pos
+        # space-time reservations after the next turn (the next one is next_pos),
+        # turns are counted from this one
+        self._reserved = {}     # (turn, pos): number of units planned there
+        self._plans = {}        # unit.id: [(turn, pos), ...] reserved by the unit
+        self.planned = 0        # move_to calls of the turn
+        self.waits = 0          # move_to calls that kept the unit waiting
     
     def update(self):
         """ need to call 'update' each turn """
         self.actions = []
         self.req_pos = self.next_pos.copy()
         self.next_pos = {}
-        self.collision = []
+        self._next_cells = {}
+        self._reserved = {}
+        self._plans = {}
+        self.planned = 0
+        self.waits = 0
+        self.collision = set()
         self.new_workers = 0
 
+    def _setNextPos(self, unit: Unit, pos: Position):
+        if unit.id in self._plans:
+            self._reserve(unit, [])
+        old = self.next_pos.get(unit.id)
+        if old is not None:
+            n = self._next_cells[old] - 1
+            if n:
+                self._next_cells[old] = n
+            else:
+                del self._next_cells[old]
+        self.next_pos[unit.id] = pos
+        self._next_cells[pos] = self._next_cells.get(pos, 0) + 1
+
     def append(self, cmd: str):
         if cmd[0] == 'd' and (self.game.id !=0 and DEBUG_ONLY_PLAYER_0):
             return
@@ -30,7 +60,7 @@ class Actions:
     def move(self, unit: Unit, dir) -> bool:
         pos = unit.pos.translate(dir, 1)            
         if self._isPosOk(pos, unit):
-            self.next_pos[unit.id] = pos
+            self._setNextPos(unit, pos)
             self.actions.append(unit.move(dir))
             return True
 #        dir = self._alternativeDirection(dir)
@@ -40,15 +70,199 @@ class Actions:
 #            self.actions.append(unit.move(dir))
 #            return True
         else:
-            self.next_pos[unit.id] = unit.pos
+            self._setNextPos(unit, unit.pos)
+            return False
+    def move_to(self, unit: Unit, target: Position, noCities=False, playerid=None, job: Job = None,
+                path=None) -> bool:
+        """
+        Moves unit toward target around the cells reserved by the units
+        planned before it (cooperative pathfinding): the unit steps,
+        or waits, along the best plan of HORIZON steps, scored by the
+        steps plus the path distance left to target (see Position.path_to
+        for the other parameters). The cells of the plan are reserved for
+        the units planned after it, for the turns the unit is in them:
+        after entering a cell the unit waits its cooldown there, reduced
+        by the road (see GameMap._cooldowns). Own citytiles are never
+        reserved.
+        With job the path found is cached by the job (see
+        GameExtended.jobPath) and followed on the next turns while its
+        cells are free, without planning again.
+        With path (Movement.path from unit.pos to target already found, e.g.
+        by GameExtended.find_resource_path) the unit follows it while its
+        cells are free, as a cached job path, and plans only otherwise.
+        Returns False (and the unit stays) only if target can't be reached
+        """
+        self.planned += 1
+        game_map = self.game.map
+        finder = get_path_finder(game_map.width, game_map.height)
+        width = finder.width
+        start = unit.pos.y * width + unit.pos.x
+        goal = target.y * width + target.x
+        if start == goal:
+            self.stay(unit)
+            return True
+        key = (target, noCities, playerid, False)
+        if path and len(path) > 1 and self._followPath(unit, path):
+            if job is not None:
+                self.game.setJobPath(job, key, path)
+            return True
+        if job is not None:
+            path = self.game.cachedJobPath(unit, job, key)
+            if path is not None and self._followPath(unit, path):
+                self.game.path_reuses += 1
+                return True
+            self.game.path_replans += 1
+        field = finder.target_field(target.x, target.y, game_map, noCities, False, playerid)
+        if field.distance(start) == UNREACHED:
+            self.stay(unit)
             return False
+        passable = field.passable
+        cooldown = self._cooldowns(unit)
+        req_pos = self.req_pos.get(unit.id)
+        # states of each step: cell: (previous cell, turn of the next action
+        # of the unit), in order of discovery, the earliest turn kept
+        steps = [{start: (None, 0)}]
+        for step in range(1, HORIZON + 1):
+            states = {}
+            for c, (_, t) in steps[-1].items():
+                if c == goal:
+                    continue
+                for n in finder.neighbors[c] + [c]:
+                    if n != c and n != goal and not passable[n]:
+                        continue
+                    k = t + 1 if n == c else t + int(cooldown[n])
+                    if n in states and states[n][1] <= k:
+                        continue
+                    pos = Position.at(n % width, n // width)
+                    if step == 1 and n != c and pos == req_pos: # have a collision
+                        self.collision.add(unit.id)
+                        continue
+                    if self._isReserved(pos, t + 1, k):
+                        continue
+                    states[n] = (c, k)
+            if not states:
+                break
+            steps.append(states)
+            if goal in states:
+                break
+        if len(steps) == 1:  # every cell is taken, even the unit one
+            self.stay(unit)
+            return False
+        # closest cell to target of the last step, the first one found on ties;
+        # the Manhattan distance bounds the path distance, cells that can't
+        # be the closest are not searched
+        def manhattan(c):
+            return abs(c % width - target.x) + abs(c // width - target.y)
+        cells = list(steps[-1])
+        best, best_distance, best_i = None, math.inf, None
+        for i in sorted(range(len(cells)), key=lambda i: manhattan(cells[i])):
+            if manhattan(cells[i]) > best_distance:
+                break
+            distance = field.distance(cells[i])
+            if distance == UNREACHED:
+                continue
+            if distance < best_distance or (distance == best_distance and i < best_i):
+                best, best_distance, best_i = cells[i], distance, i
+        if best is None:    # the steps lead only to cells cut off from target
+            self.stay(unit)
+            return False
+        plan = [best]
+        for states in reversed(steps[2:]):
+            plan.append(states[plan[-1]][0])
+        plan.reverse()
+        if plan[0] == start:
+            self.waits += 1
+            self.stay(unit)
+        else:
+            pos = Position.at(plan[0] % width, plan[0] // width)
+            self._setNextPos(unit, pos)
+            self.actions.append(unit.move(finder.direction[plan[0] - start]))
+        occupied = []   # (turn, pos) of the unit after the next turn
+        t = 0
+        for c, states in zip(plan, steps[1:]):
+            k = states[c][1]
+            pos = Position.at(c % width, c // width)
+            occupied += [(turn, pos) for turn in range(max(2, t + 1), k + 1)]
+            t = k
+        self._reserve(unit, occupied)
+        if job is not None:
+            cells = [start] + plan
+            if any(a == b for a, b in zip(cells, cells[1:])):
+                # plans with waits depend on this turn reservations
+                path = None
+            else:
+                # the plan followed by the path from its last cell
+                k = best_distance + len(plan)
+                path = [(Constants.DIRECTIONS.CENTER, unit.pos.x, unit.pos.y, k)]
+                for a, b in zip(cells, cells[1:]):
+                    k -= 1
+                    path.append((finder.direction[b - a], b % width, b // width, k))
+                path += field.path(best % width, best // width).path[1:]
+            self.game.setJobPath(job, key, path)
+        return True
+
+    def _followPath(self, unit: Unit, path) -> bool:
+        """
+        Moves unit along path (Movement.path from unit.pos) if its next
+        HORIZON cells are not reserved for the turns the unit is in them,
+        reserving them
+        """
+        first = Position.at(path[1][1], path[1][2])
+        if first == self.req_pos.get(unit.id):
+            return False
+        cooldown = self._cooldowns(unit)
+        width = self.game.map_width
+        occupied = []   # (turn, pos) of the unit after the next turn
+        t = 0
+        for _, x, y, _ in path[1:HORIZON + 1]:
+            k = t + int(cooldown[y * width + x])
+            pos = Position.at(x, y)
+            if self._isReserved(pos, t + 1, k):
+                return False
+            occupied += [(turn, pos) for turn in range(max(2, t + 1), k + 1)]
+            t = k
+        self._setNextPos(unit, first)
+        self.actions.append(unit.move(path[1][0]))
+        self._reserve(unit, occupied)
+        return True
+
+    def _cooldowns(self, unit: Unit):
+        """ Cooldown of unit in each cell (see GameMap._cooldowns) """
+        kind = "WORKER" if unit.is_worker() else "CART"
+        return self.game.map._cooldowns(UNIT_ACTION_COOLDOWN[kind])
+
+    def _isReserved(self, pos: Position, first: int, last: int) -> bool:
+        """ True if pos is taken in any turn from first to last (next turn is 1) """
+        ct = self.game.map.get_cell_by_pos(pos).citytile
+        if ct and ct.team == self.game.id:
+            return False
+        if first == 1 and pos in self._next_cells:
+            return True
+        return any((turn, pos) in self._reserved for turn in range(max(2, first), last + 1))
+
+    def _reserve(self, unit: Unit, occupied):
+        """ Reserves the (turn, pos) of occupied for unit, in place of its old ones """
+        for key in self._plans.pop(unit.id, []):
+            n = self._reserved[key] - 1
+            if n:
+                self._reserved[key] = n
+            else:
+                del self._reserved[key]
+        for key in occupied:
+            self._reserved[key] = self._reserved.get(key, 0) + 1
+        self._plans[unit.id] = occupied
+
     def build_city(self, unit: Unit):
-        self.next_pos[unit.id] = unit.pos
+        self._setNextPos(unit, unit.pos)
         self.actions.append(unit.build_city())
         return True
 
     def stay(self, unit: Unit) -> bool:
-        self.next_pos[unit.id] = unit.pos
+        self._setNextPos(unit, unit.pos)
+        # a unit cooling down is still there until it can act again
+        turns = int(unit.cooldown)
+        if turns >= 2:
+            self._reserve(unit, [(turn, unit.pos) for turn in range(2, turns + 1)])
         return True
     
     def build_worker(self, ct: CityTile):
@@ -69,11 +283,11 @@ class Actions:
             return False
         if not 0 <= pos.y < self.game.map_height:
             return False
-        if pos in self.next_pos.values():
+        if pos in self._next_cells:
             return False
         if unit.id in self.req_pos:     
             if self.req_pos[unit.id] == pos: # have a collision 
-                self.collision.append(unit.id)
+                self.collision.add(unit.id)
                 return False
         return True
 
@@ -2,58 +2,206 @@
 # ---
 # The Game class with steroids
 
-import math
 import weakref
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Set
 
-from abn.jobs import JobBoard
+from abn.jobs import JobBoard, Job, Task
+
+import numpy as np
 
 from lux.game import Game
-from lux.game_map import Position, Cell
+from lux.game_map import Position, Cell, Movement
+from lux.pathfinding import get_path_finder, NO_PATH
+from lux.array_map import ArrayGameMap, RESOURCE_CODES
+from lux.spatial import ResourceIndex, ResourceClusters, GridIndex, manhattan
 from lux.constants import Constants
 from lux.game_objects import Unit
+from lux.game_constants import GAME_CONSTANTS
 
 DIRECTIONS = Constants.DIRECTIONS
+UNIT_ACTION_COOLDOWN = GAME_CONSTANTS["PARAMETERS"]["UNIT_ACTION_COOLDOWN"]
+DAY_LENGTH = GAME_CONSTANTS["PARAMETERS"]["DAY_LENGTH"]
+NIGHT_LENGTH = GAME_CONSTANTS["PARAMETERS"]["NIGHT_LENGTH"]
+CYCLE_LENGTH = DAY_LENGTH + NIGHT_LENGTH
+NIGHT_START = DAY_LENGTH - 1    # turn of the cycle the agent plays as the first night turn
 RESOURCE_TYPES = Constants.RESOURCE_TYPES
 
 EVENING_HOURS = 10    # evening duration (end of day before night)
 MORNING_HOURS = 10    # morning duration (start of day after night) 
+SAFE_PATH_HORIZON = 20  # turns searched by safePath
+FREESPACE_RADIUS = 10   # cells searched by find_closest_freespace
+DIRTY_LOG_UPDATES = 10  # updates of dirty cells kept to patch the layers (see Layer)
 NEIGHBORS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
 
+def is_night(turn) -> bool:
+    """ True if the agent plays turn as a night turn (see GameExtended.isNight) """
+    return turn % CYCLE_LENGTH >= NIGHT_START
+
+class Layer:
+    """
+    Derived map of GameExtended, computed on first access. On the first
+    access after an update it is kept if none of its dependencies changed,
+    patched or built again otherwise (see GameExtended._refresh_layer).
+    An array dependency changes as a whole: a single harvested cell changes
+    the "resource_amount" array.
+    - build   : GameExtended method returning the map
+    - depends : names of the ArrayGameMap arrays, of the other layers or
+                "research", the map is computed from
+    - patch   : GameExtended method returning the map updated for the cells
+                (x, y) changed since it was computed (GameMap.dirty of the
+                updates in between), or the map itself if it did not change:
+                then the layers computed from it are kept too. Used instead
+                of build when only arrays of the map and patched layers
+                changed. The map can be shared with a snapshot: it must be
+                copied, not changed.
+    """
+    def __init__(self, build, depends: Tuple[str, ...], patch=None):
+        self.build = build
+        self.depends = depends
+        self.patch = patch
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, game, owner=None):
+        if game is None:
+            return self
+        if self.name in game._valid:
+            game.layer_hits[self.name] += 1
+            return game._layers[self.name][0]
+        return game._refresh_layer(self)
+
+
 class GameExtended(Game):
     """ A Game class with steroids """
 
+    # layers in dependency order
+    LAYERS = ("energy_map", "explore_map", "enemy_map", "invasion_map", "expand_map",
+              "explore_index", "invasion_index", "free_cells", "freespace_memo")
+
     def __init__(self):
-        Game.__init__(self)
+        Game.__init__(self, incremental=True, map_class=ArrayGameMap, distances=True)
         self.time = 0
         self.lux_time = 0
         self.job_board = JobBoard(self)
         #self.resource_tiles = []
-        self.energy_map = {}    # energy value a unit can draw for each cell
-        self.explore_map = {}   # position in near a resource where to explore and build city
-        self.enemy_map = {}     # position of enemy citytiles
-        self.invasion_map = {}  # map of cell adjacent to enemy citytiles
-        self.expand_map = {}    # for each player city a list of adjacent cells and energy useable to expand
-                                # ex: { "city.id": [(x,y,energy), (x,y,energy), ...] }
-    
+        # computed layers (see Layer), name: (map, version, update of the
+        # computation, versions of its layer dependencies, version of the last build)
+        self._layers = {}
+        self._valid = set()     # layers checked since the last update
+        self._updates = 0       # updates of the game
+        self._changed_at = {}   # array name or "research": last update that changed it
+        self._dirty_log = {}    # update: map.dirty of the update, the last DIRTY_LOG_UPDATES ones
+        self._research = None   # (researched_coal, researched_uranium) of the player
+        self.layer_hits = dict.fromkeys(self.LAYERS, 0)     # accesses to an up to date layer
+        self.layer_misses = dict.fromkeys(self.LAYERS, 0)   # computations of a layer
+        self.layer_patches = dict.fromkeys(self.LAYERS, 0)  # updates of a layer around the dirty cells
+        self._resource_field = None     # search from the free resources, one per turn
+        self.resources = None   # ResourceIndex of the map
+        self.clusters = None    # ResourceClusters of the map
+        self.path_reuses = 0    # job paths of the previous turn still valid
+        self.path_replans = 0   # job paths computed again
+
 
     def _update(self, messages):
         if messages["step"] == 0:
             Game._initialize(self, messages["updates"])
             Game._update(self, messages["updates"][2:])
             self.id = messages.player
+            self.resources = ResourceIndex(self.map_width, self.map_height)
+            self.clusters = ResourceClusters(self.map_width, self.map_height)
         else:
+            if self._shared:  # resources and clusters shared with a snapshot
+                self.resources = self.resources.copy()
+                self.clusters = self.clusters.copy()
             Game._update(self, messages["updates"])
         self.player = self.players[self.id]
         self.opponent = self.players[(self.id + 1) % 2]
         #self.resource_tiles = self._free_resources()
-        self.job_board.checkActiveJobs(self.player.units, self.player.cities)
-        self.time = self.turn % 40
-        self.lux_time = max( 0 , 29 - self.time)
-        self._build_energy_map() # fill also the explore_map
-        self._build_enemy_map()
-        self._build_invasion_map()
-        self._build_expand_map()
+        self.resources.update(self.map)
+        self.clusters.update(self.map)
+        self.job_board.handleEvents(self.events, self.id)
+        self.time = self.turn % CYCLE_LENGTH
+        self.lux_time = max( 0 , NIGHT_START - self.time)
+        self._invalidate_layers()
+        self._resource_field = None
+
+    def _invalidate_layers(self):
+        """
+        Records what the last update changed, the layers are checked again
+        on their next access (see _refresh_layer)
+        """
+        self._updates += 1
+        for name in self.map.changed:
+            self._changed_at[name] = self._updates
+        research = (self.player.researched_coal(), self.player.researched_uranium())
+        if research != self._research:
+            self._research = research
+            self._changed_at["research"] = self._updates
+        self._dirty_log[self._updates] = self.map.dirty
+        self._dirty_log.pop(self._updates - DIRTY_LOG_UPDATES, None)
+        self._valid = set()
+
+    def _refresh_layer(self, layer: Layer):
+        """
+        The map of layer for this update: the one computed before if none of
+        its dependencies changed since, patched if only arrays of the map
+        and patched layers changed, built again otherwise
+        """
+        name = layer.name
+        depends = [d for d in layer.depends if d in self.LAYERS]
+        for d in depends:
+            getattr(self, d)    # brought up to date first
+        versions = tuple(self._layers[d][1] for d in depends)
+        entry = self._layers.get(name)
+        if entry is None:
+            self.layer_misses[name] += 1
+            value, version, built = layer.build(self), 0, 0
+        else:
+            value, version, seen, seen_versions, built = entry
+            arrays = [d for d in layer.depends if self._changed_at.get(d, 0) > seen]
+            layers = [d for d, v, old in zip(depends, versions, seen_versions) if v != old]
+            if not arrays and not layers:
+                self.layer_hits[name] += 1
+            elif layer.patch is not None and "research" not in arrays and \
+                    self._updates - seen <= DIRTY_LOG_UPDATES and \
+                    all(self._layers[d][4] <= old for d, old in zip(depends, seen_versions)):
+                self.layer_patches[name] += 1
+                cells = set().union(*(self._dirty_log[u] for u in range(seen + 1, self._updates + 1)))
+                patched = layer.patch(self, value, cells)
+                if patched is not value:
+                    value, version = patched, version + 1
+            else:
+                self.layer_misses[name] += 1
+                value, version = layer.build(self), version + 1
+                built = version
+        self._layers[name] = (value, version, self._updates, versions, built)
+        self._valid.add(name)
+        return value
+
+    def snapshot(self) -> 'GameExtended':
+        """
+        Copy-on-write copy of the game state (see Game.snapshot) with its own
+        JobBoard: the jobs can be assigned and changed in the copy.
+        The derived maps (energy_map, explore_map, ...), the resource index
+        and the resource clusters are shared, the next update of each game
+        copies the last two before changing them.
+        """
+        game = Game.snapshot(self)
+        if hasattr(self, "player"):
+            game.player = game.players[self.id]
+            game.opponent = game.players[(self.id + 1) % 2]
+        game.job_board = self.job_board.copy(game)
+        game._layers = dict(self._layers)
+        game._valid = set(self._valid)
+        game._changed_at = dict(self._changed_at)
+        game._dirty_log = dict(self._dirty_log)
+        game.layer_hits = dict(self.layer_hits)
+        game.layer_misses = dict(self.layer_misses)
+        game.layer_patches = dict(self.layer_patches)
+        return game
+
+    clone = snapshot
 
     def isEvening(self):
         return (0 < self.lux_time <= EVENING_HOURS)
@@ -62,38 +210,173 @@ class GameExtended(Game):
         return (self.time < MORNING_HOURS)
     
     def isNight(self):
-        return (self.lux_time < 1)
+        return is_night(self.turn)
+
+    def canArriveBeforeNight(self, unit: Unit, pos: Position, noCities=False) -> bool:
+        """
+        True if unit can reach pos before the night, by the path of the
+        fewest turns (roads and cooldown included, see Position.path_to).
+        Always False at night: use safePath instead.
+        """
+        cooldown = UNIT_ACTION_COOLDOWN["WORKER" if unit.is_worker() else "CART"]
+        move = unit.pos.path_to(pos, self.map, noCities=noCities, playerid=self.id, cooldown=cooldown)
+        return bool(move.path) and unit.cooldown + move.arrival <= self.lux_time
+
+    def jobPath(self, unit: Unit, job: Job, noCities=False, playerid=None, astar=False) -> Movement:
+        """
+        unit.pos.path_to(job.pos, ...) cached by the job across the turns:
+        the path is computed again only if the unit left it or one of its
+        cells can no longer be entered
+        """
+        key = (job.pos, noCities, playerid, astar)
+        path = self.cachedJobPath(unit, job, key)
+        if path is not None:
+            self.path_reuses += 1
+            return Movement(path[1][0], path)
+        self.path_replans += 1
+        move = unit.pos.path_to(job.pos, self.map, noCities=noCities, playerid=playerid, astar=astar)
+        self.setJobPath(job, key, move.path)
+        return move
+
+    def cachedJobPath(self, unit: Unit, job: Job, key):
+        """
+        Path (Movement.path) cached by job with the parameters key, from
+        unit.pos to job.pos, None if it has to be computed again. Only the
+        cells changed by the last update (map.dirty) are checked if the path
+        has been checked the turn before, all of them otherwise.
+        """
+        path = job.path
+        if not path or job.path_key != key:
+            return None
+        pos = unit.pos
+        if len(path) > 1 and path[1][1] == pos.x and path[1][2] == pos.y:
+            path = path[1:]     # the unit did the first step
+        elif path[0][1] != pos.x or path[0][2] != pos.y:
+            return None
+        if len(path) < 2:
+            return None
+        _, noCities, playerid, _ = key
+        passable = self.map._passable(noCities, False, playerid)
+        width = self.map_width
+        dirty = self.map.dirty if job.path_turn >= self.turn - 1 else None
+        # the target can always be entered
+        for _, x, y, _ in path[1:-1]:
+            if (dirty is None or (x, y) in dirty) and not passable[y * width + x]:
+                return None
+        job.path = path
+        job.path_turn = self.turn
+        return path
+
+    def setJobPath(self, job: Job, key, path):
+        """ Caches in job the path (Movement.path) computed with parameters key """
+        job.path = path or None
+        job.path_key = key
+        job.path_turn = self.turn
+
+    def safePath(self, unit: Unit, pos: Position, noCities=False, horizon=SAFE_PATH_HORIZON) -> Movement:
+        """
+        Path of the fewest turns from unit to pos that never leaves the
+        unit out of the citytiles without the fuel for the night (see
+        PathFinder.night_safe), Movement(CENTER, []) if there is none
+        within horizon turns
+        """
+        finder = get_path_finder(self.map_width, self.map_height)
+        kind = "WORKER" if unit.is_worker() else "CART"
+        # the night played by the agent lasts CYCLE_LENGTH - NIGHT_START turns
+        night = [is_night(self.turn + k) for k in range(horizon + CYCLE_LENGTH - NIGHT_START + 1)]
+        shelter = (self.map.citytile_team == self.id).ravel().tolist()
+        # a worker next to a resource gathers more than its upkeep
+        income = unit.light_upkeep if unit.is_worker() and self.getEnergy(pos.x, pos.y) else 0
+        return finder.night_safe(pos.x, pos.y, unit.pos.x, unit.pos.y,
+                                 self.map._passable(noCities, False, self.id),
+                                 self.map._cooldowns(UNIT_ACTION_COOLDOWN[kind]), shelter, night,
+                                 unit.energy, unit.light_upkeep, horizon, int(unit.cooldown), income)
 
     def _build_energy_map(self):
-        self.explore_map = {}
-        for x in range(self.map_width):
-            for y in range(self.map_height):
-                energy = self._getEnergy(x, y)
-                self.energy_map[x,y] = energy
-                if energy and not self.map.get_cell(x, y).has_resource() and not self.map.get_cell(x, y).citytile:
-                    self.explore_map[x,y] = 1
-    
+        energy = self._energy_grid()
+        # transposed to keep the x-major order of the keys
+        keys = ((x, y) for x in range(self.map_width) for y in range(self.map_height))
+        return dict(zip(keys, energy.T.ravel().tolist()))
+
+    def _around(self, cells):
+        """ The cells and their neighbors on the map """
+        width, height = self.map_width, self.map_height
+        around = set(cells)
+        for x, y in cells:
+            around.update((x + dx, y + dy) for dx, dy in NEIGHBORS)
+        return [(x, y) for x, y in around if 0 <= x < width and 0 <= y < height]
+
+    def _patch_energy_map(self, energy_map, cells):
+        # the energy of a cell changes with the fuel of the cell or of a neighbor
+        fuel = self._fuel_map().tolist()
+        width, height = self.map_width, self.map_height
+        patched = energy_map
+        for x, y in self._around(cells):
+            row = fuel[y]
+            energy = row[x]
+            if y > 0:
+                energy += fuel[y - 1][x]
+            if y < height - 1:
+                energy += fuel[y + 1][x]
+            if x > 0:
+                energy += row[x - 1]
+            if x < width - 1:
+                energy += row[x + 1]
+            if energy != patched[x, y]:
+                if patched is energy_map:
+                    patched = dict(energy_map)
+                patched[x, y] = energy
+        return patched
+
+    def _build_explore_map(self):
+        free = ((self.map.resource_amount <= 0) & (self.map.citytile_team < 0)).tolist()
+        return {(x, y): 1 for (x, y), energy in self.energy_map.items() if energy and free[y][x]}
+
+    def _patch_explore_map(self, explore_map, cells):
+        # the energy changes around the changed cells (see _patch_energy_map),
+        # built again on a change to keep the order of the keys
+        energy_map = self.energy_map
+        amount, team = self.map.resource_amount, self.map.citytile_team
+        for x, y in self._around(cells):
+            explore = bool(energy_map[x, y] and amount[y, x] <= 0 and team[y, x] < 0)
+            if explore != ((x, y) in explore_map):
+                return self._build_explore_map()
+        return explore_map
+
+    def _build_free_cells(self):
+        return ((self.map.resource_amount <= 0) & (self.map.citytile_team < 0)).ravel().tolist()
+
+    def _patch_free_cells(self, free_cells, cells):
+        amount, team = self.map.resource_amount, self.map.citytile_team
+        width = self.map_width
+        changes = [(y * width + x, bool(amount[y, x] <= 0 and team[y, x] < 0)) for x, y in cells]
+        if all(free_cells[c] == free for c, free in changes):
+            return free_cells
+        free_cells = list(free_cells)
+        for c, free in changes:
+            free_cells[c] = free
+        return free_cells
+
     def _build_enemy_map(self):
-        self.enemy_map = {}
-        for x in range(self.map_width):
-            for y in range(self.map_height):
-                ct = self.map.get_cell(x, y).citytile
-                if ct and ct.team != self.id:
-                    self.enemy_map[x,y] = 1
+        team = self.map.citytile_team
+        # transposed to keep the x-major order of the keys
+        xs, ys = np.nonzero(((team >= 0) & (team != self.id)).T)
+        return dict.fromkeys(zip(xs.tolist(), ys.tolist()), 1)
 
     # build a map of all neighboring cells of enemy_map
     def _build_invasion_map(self):
-        self.invasion_map = {} 
+        invasion_map = {}
         for x, y in self.enemy_map:
             for dx, dy in NEIGHBORS:
                 if 0 <= x + dx < self.map_width and 0 <= y + dy < self.map_height:
                     if not self.map.get_cell(x + dx, y + dy).citytile:
-                        self.invasion_map[x + dx, y + dy] = 1
+                        invasion_map[x + dx, y + dy] = 1
+        return invasion_map
 
     def _build_expand_map(self):
-        self.expand_map = {}
+        expand_map = {}
         for id, city in self.player.cities.items():
-            self.expand_map[id] = []
+            expand_map[id] = []
             for ct in city.citytiles:
                 for dx, dy in NEIGHBORS:
                     x = ct.pos.x + dx
@@ -101,104 +384,214 @@ class GameExtended(Game):
                     if 0 <= x < self.map_width and 0 <= y < self.map_height:
                         if not self.map.get_cell(x, y).citytile and \
                             not self.map.get_cell(x, y).has_resource():
-                            self.expand_map[id].append((x, y, self.getEnergy(x,y)))
-            self.expand_map[id].sort(key=lambda x: x[2], reverse=True)   
+                            expand_map[id].append((x, y, self.getEnergy(x,y)))
+            expand_map[id].sort(key=lambda x: x[2], reverse=True)
+        return expand_map
+
+    # energy value a unit can draw for each cell
+    energy_map = Layer(_build_energy_map, ("resource_type", "resource_amount", "research"), _patch_energy_map)
+    # position in near a resource where to explore and build city
+    explore_map = Layer(_build_explore_map, ("energy_map", "resource_amount", "citytile_team"), _patch_explore_map)
+    # position of enemy citytiles
+    enemy_map = Layer(_build_enemy_map, ("citytile_team",))
+    # map of cell adjacent to enemy citytiles
+    invasion_map = Layer(_build_invasion_map, ("enemy_map", "citytile_team"))
+    # nearest neighbor queries on explore_map and invasion_map
+    explore_index = Layer(lambda game: GridIndex(game.explore_map), ("explore_map",))
+    invasion_index = Layer(lambda game: GridIndex(game.invasion_map), ("invasion_map",))
+    # for each player city a list of adjacent cells and energy useable to expand
+    # ex: { "city.id": [(x,y,energy), (x,y,energy), ...] }
+    expand_map = Layer(_build_expand_map, ("energy_map", "resource_type", "resource_amount",
+                                           "citytile_team", "citytile_id"))
+    # cells without citytile and resource, flat list indexed by y * map_width + x
+    free_cells = Layer(_build_free_cells, ("resource_amount", "citytile_team"), _patch_free_cells)
+    # results of find_closest_freespace, { (x, y, max_radius): Position }
+    freespace_memo = Layer(lambda game: {}, ("free_cells",))
 
-    def getClosestInvasionTarget(self, pos: Position) -> Position:
+    def distance(self, a: Position, b: Position) -> int:
         """
-        Returns the closest invasion target position
+        Walking distance from a to b, units aside (see Game.distances),
+        NO_PATH if b can't be reached. Manhattan distance before the first
+        update or if a or b is off the map.
         """
-        closest_invasion = None
-        closest_distance = math.inf
-        for x, y in self.invasion_map:
-            distance = pos.distance_to(Position(x, y))
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_invasion = Position(x, y)
-        return closest_invasion
+        if self.distances is None or not (self._onMap(a) and self._onMap(b)):
+            return a.distance_to(b)
+        return self.distances.distance(a.x, a.y, b.x, b.y)
 
-    def getClosestExploreTarget(self, pos: Position, min_distance = 0) -> Position:
+    def _onMap(self, pos: Position) -> bool:
+        return 0 <= pos.x < self.map_width and 0 <= pos.y < self.map_height
+
+    def _distances_from(self, pos: Position) -> List[int]:
+        """ Walking distances from pos to each cell, indexed by y * map_width + x """
+        return self.distances.row(pos.x, pos.y).tolist()
+
+    def _walking_distance(self, pos: Position):
         """
-        Returns the closest explore target position
+        Walking distance from pos to (x, y), None if unreachable (see
+        GridIndex.k_nearest), Manhattan distance if pos is off the map
         """
-        closest_explore = None
-        closest_distance = math.inf
-        for x, y in self.explore_map:
-            distance = pos.distance_to(Position(x, y))
-            if min_distance <= distance < closest_distance:
-                closest_distance = distance
-                closest_explore = Position(x, y)
-        return closest_explore
+        if not self._onMap(pos):
+            return manhattan(pos)
+        distances = self._distances_from(pos)
+        width = self.map_width
+
+        def distance(x, y):
+            d = distances[y * width + x]
+            return None if d == NO_PATH else d
+
+        return distance
+
+    def getClosestInvasionTarget(self, pos: Position, exclude=()) -> Position:
+        """
+        Returns the closest invasion target position (walking distance),
+        positions in exclude are skipped
+        """
+        xy = self.invasion_index.nearest(pos, exclude=exclude, distance=self._walking_distance(pos))
+        return Position.at(*xy) if xy else None
+
+    def getClosestExploreTarget(self, pos: Position, min_distance = 0, exclude=()) -> Position:
+        """
+        Returns the closest explore target position (walking distance),
+        positions in exclude are skipped
+        """
+        xy = self.explore_index.nearest(pos, min_distance, exclude, self._walking_distance(pos))
+        return Position.at(*xy) if xy else None
+
+    def crowdedClusterCells(self) -> Set[Position]:
+        """
+        Perimeter cells of the resource clusters with at least as many
+        workers (units with a HARVEST job) as resource cells, see
+        ResourceClusters.count_workers
+        """
+        workers = self.clusters.count_workers(
+            job.pos for job in self.job_board.inprogress.values() if job.task == Task.HARVEST)
+        return {Position.at(x, y) for cluster in self.clusters if workers[cluster.id] >= len(cluster.cells)
+                for x, y in cluster.perimeter}
 
     def getEnergy(self, x, y) -> int:
         return self.energy_map[x,y]
 
-    def _getEnergy(self, px, py) -> int:
-        energy = 0
-        # get energy from the cell
-        for x, y in [(px, py), (px-1, py), (px, py-1), (px+1, py), (px, py+1)]:
-            if not 0 <= x < self.map_width:
-                continue
-            if not 0 <= y < self.map_height:
-                continue
-            cell = self.map.get_cell(x, y)
-            if cell.has_resource():
-                if cell.resource.type == Constants.RESOURCE_TYPES.COAL and self.player.researched_coal():
-                    energy += cell.resource.amount * Constants.RESOURCE_TO_FUEL_RATE.COAL
-                if cell.resource.type == Constants.RESOURCE_TYPES.URANIUM and self.player.researched_uranium():
-                    energy += cell.resource.amount * Constants.RESOURCE_TO_FUEL_RATE.URANIUM
-                if cell.resource.type == Constants.RESOURCE_TYPES.WOOD:
-                    energy += cell.resource.amount * Constants.RESOURCE_TO_FUEL_RATE.WOOD
+    def _fuel_map(self) -> np.ndarray:
+        """ Fuel value of each cell, only for resources the player can harvest """
+        rate = np.zeros(len(RESOURCE_CODES) + 1, dtype=np.int64)
+        rate[RESOURCE_CODES[RESOURCE_TYPES.WOOD]] = Constants.RESOURCE_TO_FUEL_RATE.WOOD
+        rate[RESOURCE_CODES[RESOURCE_TYPES.COAL]] = Constants.RESOURCE_TO_FUEL_RATE.COAL
+        rate[RESOURCE_CODES[RESOURCE_TYPES.URANIUM]] = Constants.RESOURCE_TO_FUEL_RATE.URANIUM
+        fuel = rate[self.map.resource_type] * self.map.resource_amount
+        return np.where(self._researched_resources(), fuel, 0)
+
+    def _energy_grid(self) -> np.ndarray:
+        """
+        Energy a unit can draw from each cell: fuel of the cell and of its 4
+        neighbors (cross shaped kernel), cells out of the map give nothing
+        """
+        fuel = self._fuel_map()
+        energy = fuel.copy()
+        energy[1:, :] += fuel[:-1, :]
+        energy[:-1, :] += fuel[1:, :]
+        energy[:, 1:] += fuel[:, :-1]
+        energy[:, :-1] += fuel[:, 1:]
         return energy
-                    
+
+    def _researched_resources(self) -> np.ndarray:
+        """ Mask of the cells with a resource the player can harvest """
+        r_type = self.map.resource_type
+        mask = r_type == RESOURCE_CODES[RESOURCE_TYPES.WOOD]
+        if self.player.researched_coal():
+            mask |= r_type == RESOURCE_CODES[RESOURCE_TYPES.COAL]
+        if self.player.researched_uranium():
+            mask |= r_type == RESOURCE_CODES[RESOURCE_TYPES.URANIUM]
+        return mask & (self.map.resource_amount > 0)
+
     def _free_resources(self):
         resource_tiles: list[Cell] = []
-        for y in range(self.map_height):
-            for x in range(self.map_width):
-                cell = self.map.get_cell(x, y)
-                if cell.has_resource():
-                    if cell.resource.type == Constants.RESOURCE_TYPES.COAL and not self.player.researched_coal():
-                        continue
-                    if cell.resource.type == Constants.RESOURCE_TYPES.URANIUM and not self.player.researched_uranium():
-                        continue
-                    # only resources without inprogress active tasks
-                    if not self.job_board.activeJobToPos(cell.pos): 
-                        resource_tiles.append(cell)
+        ys, xs = np.nonzero(self._researched_resources())
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            cell = self.map.get_cell(x, y)
+            # only resources without inprogress active tasks
+            if not self.job_board.activeJobToPos(cell.pos):
+                resource_tiles.append(cell)
         return resource_tiles
 
+    def _harvestable_types(self) -> List[str]:
+        """ Resource types the player has researched """
+        types = [RESOURCE_TYPES.WOOD]
+        if self.player.researched_coal():
+            types.append(RESOURCE_TYPES.COAL)
+        if self.player.researched_uranium():
+            types.append(RESOURCE_TYPES.URANIUM)
+        return types
+
     def find_closest_resources(self, pos, min_distance = 0):
-        resource_tiles = self._free_resources()
-        closest_dist = math.inf
-        closest_resource_tile = None
-        for resource_tile in resource_tiles:
-            # we skip over resources that we can't mine due to not having researched them
-            # if resource_tile.resource.type == Constants.RESOURCE_TYPES.COAL and not self.player.researched_coal():
-            #    continue
-            #if resource_tile.resource.type == Constants.RESOURCE_TYPES.URANIUM and not self.player.researched_uranium():
-            #    continue
-            dist = resource_tile.pos.distance_to(pos)
-            if min_distance <= dist < closest_dist:
-                closest_dist = dist
-                closest_resource_tile = resource_tile
-        return closest_resource_tile
-
-    def find_closest_freespace(self, pos):
-        open_list = [(pos.x, pos.y)]
-        check_dirs = [
-            DIRECTIONS.NORTH,
-            DIRECTIONS.EAST,
-            DIRECTIONS.SOUTH,
-            DIRECTIONS.WEST
-        ]
-        while open_list:
-            cur_pos = open_list.pop(0)
-            x, y = cur_pos
-            if  not self.map.get_cell(x, y).citytile and \
-                not self.map.get_cell(x, y).has_resource():
-                return Position(x, y)
-
-            # cur_cell = self.map.get_cell(cur_pos[0], cur_pos[1])
-            for dx, dy in NEIGHBORS:
-                if 0 <= x+dx < self.map_width and 0 <= y+dy < self.map_height:
-                    open_list.append((x + dx, y + dy))
-        return pos
\ No newline at end of file
+        """
+        Cell of the closest resource (walking distance) the player can
+        harvest and without inprogress jobs, None if none. Ties go to the
+        first cell in row order.
+        """
+        xy = self.resources.nearest(pos, self._harvestable_types(), min_distance,
+                                    self.job_board.activeJobPositions(), self._walking_distance(pos))
+        return self.map.get_cell(*xy) if xy else None
+
+    def find_resource_path(self, pos: Position) -> Movement:
+        """
+        Path to the closest free resource by path distance (units and enemy
+        citytiles are obstacles), the last step of the path is the resource.
+        All the calls of a turn share one search from the resources free at
+        the first call: if the resource found has been taken since, the
+        closest one of find_closest_resources is used.
+        Returns Movement(CENTER, []) if no resource can be reached.
+        """
+        if self._resource_field is None:
+            finder = get_path_finder(self.map_width, self.map_height)
+            resources = [(cell.pos.x, cell.pos.y) for cell in self._free_resources()]
+            self._resource_field = finder.field(resources, self.map._passable(False, False, self.id))
+        move = self._resource_field.path(pos.x, pos.y)
+        if move.path:
+            _, x, y, _ = move.path[-1]
+            if self.job_board.activeJobToPos(Position.at(x, y)):
+                tile = self.find_closest_resources(pos)
+                if not tile:
+                    return Movement(DIRECTIONS.CENTER, [])
+                return pos.path_to(tile.pos, self.map, playerid=self.id)
+        return move
+
+    def find_closest_freespace(self, pos, max_radius=FREESPACE_RADIUS) -> Position:
+        """
+        Closest cell to pos without citytile and resource (Manhattan
+        distance, the first one reached in NEIGHBORS order on ties), at
+        most max_radius away, pos if none. Memoized until the resources or the citytiles
+        change (see freespace_memo).
+        """
+        key = (pos.x, pos.y, max_radius)
+        memo = self.freespace_memo
+        found = memo.get(key)
+        if found is None:
+            found = memo[key] = self._search_freespace(pos, max_radius)
+        return found
+
+    def _search_freespace(self, pos, max_radius) -> Position:
+        """ Breadth-first search of find_closest_freespace, each cell is visited once """
+        free = self.free_cells
+        width, height = self.map_width, self.map_height
+        start = pos.y * width + pos.x
+        if free[start]:
+            return pos
+        visited = bytearray(width * height)
+        visited[start] = 1
+        frontier = [(pos.x, pos.y)]
+        for _ in range(max_radius):
+            next_frontier = []
+            for x, y in frontier:
+                for dx, dy in NEIGHBORS:
+                    nx, ny = x + dx, y + dy
+                    if 0 <= nx < width and 0 <= ny < height:
+                        i = ny * width + nx
+                        if not visited[i]:
+                            if free[i]:
+                                return Position.at(nx, ny)
+                            visited[i] = 1
+                            next_frontier.append((nx, ny))
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return pos
@@ -6,6 +6,8 @@ import math
 from typing import Tuple, List, Dict
 from lux.game_map import Position, Cell
 from lux.game_objects import Unit
+from lux.game import Event
+from lux.pathfinding import NO_PATH
 class Task:
     """
     Each task consist on a type of Job for a single unit.
@@ -32,17 +34,42 @@ def TaskStr(task: str) -> str:
     return(_strings_[task])
 class Job:
     def __init__(self, task: str, pos: Position):
-        self.pos: Position = pos    # some task need a position reference
+        self._board = None          # JobBoard where the job is active (todo or inprogress)
+        self._pos: Position = pos   # some task need a position reference
         self.task: str = task       # task type
         self.city_id: str = ""      # city_id parameter used by some tasks
         self.unit_id: str = ""      # unit_id that has this task as assignement
         self.subtask: int = 0       # subtask used by jobs with multistate tasks 
         self.isNew : bool = True    # True if this job is assigned to a new unit
         self.data   = {}              # Data storage for multistate tasks
+        self.path = None            # cached path to pos (see GameExtended.jobPath)
+        self.path_key = None        # search parameters of the cached path
+        self.path_turn = -1         # last turn the cached path has been checked
+
+    @property
+    def pos(self) -> Position:
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos: Position):
+        # keep the position index of the board up to date
+        board = self._board
+        if board:
+            board._unindex(self)
+        self._pos = pos
+        if board:
+            board._index(self)
 
     def __str__(self):
         return f"{self.unit_id}: {TaskStr(self.task)}.{self.subtask} {self.pos} c:{self.city_id}"
 
+    def _copy(self, board) -> 'Job':
+        job = Job.__new__(Job)
+        job.__dict__.update(self.__dict__)
+        job._board = board
+        job.data = dict(self.data)
+        return job
+
 class JobBoard:
     """
     This is a Bulletin Board with 3 different lists:
@@ -57,6 +84,68 @@ class JobBoard:
         self.done: List = []        # Done Jobs
         self.rip: List = []         # Dead Units
         self.parent = parent
+        # number of jobs for each position, for O(1) lookups
+        self._active_pos: Dict[Position, int] = {}      # todo and inprogress jobs
+        self._inprogress_pos: Dict[Position, int] = {}  # inprogress jobs
+
+    def copy(self, parent) -> 'JobBoard':
+        """
+        Copy of the board for the game 'parent' (see GameExtended.snapshot),
+        the jobs are copied and can be changed without touching this board
+        """
+        board = JobBoard(parent)
+        board.todo = [job._copy(board) for job in self.todo]
+        board.inprogress = {unit_id: job._copy(board) for unit_id, job in self.inprogress.items()}
+        board.done = list(self.done)
+        board.rip = list(self.rip)
+        board._active_pos = dict(self._active_pos)
+        board._inprogress_pos = dict(self._inprogress_pos)
+        return board
+
+    def _index(self, job: Job):
+        if job.pos is None:
+            return
+        self._active_pos[job.pos] = self._active_pos.get(job.pos, 0) + 1
+        if self.inprogress.get(job.unit_id) is job:
+            self._inprogress_pos[job.pos] = self._inprogress_pos.get(job.pos, 0) + 1
+
+    def _unindex(self, job: Job):
+        if job.pos is None:
+            return
+        self._decrement(self._active_pos, job.pos)
+        if self.inprogress.get(job.unit_id) is job:
+            self._decrement(self._inprogress_pos, job.pos)
+
+    @staticmethod
+    def _decrement(index: Dict, pos: Position):
+        n = index[pos] - 1
+        if n:
+            index[pos] = n
+        else:
+            del index[pos]
+
+    def _addTodo(self, job: Job):
+        self.todo.append(job)
+        job._board = self
+        self._index(job)
+
+    def _popTodo(self, i: int) -> Job:
+        job = self.todo.pop(i)
+        self._unindex(job)
+        job._board = None
+        return job
+
+    def _addInprogress(self, job: Job):
+        self.inprogress[job.unit_id] = job
+        job._board = self
+        self._index(job)
+
+    def _delInprogress(self, unit_id: str) -> Job:
+        job = self.inprogress[unit_id]
+        self._unindex(job)
+        del self.inprogress[unit_id]
+        job._board = None
+        return job
 
     def _nextJob(self, unit: Unit):
         # TODO: need a heuristics for job selection based on different parameters:
@@ -72,7 +161,9 @@ class JobBoard:
                 if not self.todo[n].pos:
                     distance = 100 # fake distance for jobs without position
                 else:
-                    distance = unit.pos.distance_to(self.todo[n].pos)
+                    distance = self.parent.distance(unit.pos, self.todo[n].pos)
+                    if distance == NO_PATH: # not reachable by this unit
+                        continue
                 
 
                 if self.todo[n].task == Task.ENERGIZE:  # if not reacheable result is 0
@@ -100,7 +191,7 @@ class JobBoard:
                     score = temp_score            
 
             if i is not None:
-                return self.todo.pop(i)
+                return self._popTodo(i)
             else:
                 return None
         else:
@@ -113,10 +204,10 @@ class JobBoard:
 
     def addJob(self, task: str, pos: Position, city_id: str = "") -> bool:
         # Check if no other active jobs are present for that position
-        if not pos in [ j.pos for j in self._activeJobs()]:
+        if pos not in self._active_pos:
             job = Job(task, pos)
             job.city_id = city_id
-            self.todo.append(job)
+            self._addTodo(job)
             return True
         else:
             return False
@@ -128,10 +219,9 @@ class JobBoard:
         that rejected it.
         """
         if unit_id in self.inprogress:
-            j = self.inprogress[unit_id]
+            j = self._delInprogress(unit_id)
             j.subtask = 0
-            self.todo.append(j)
-            del self.inprogress[unit_id]
+            self._addTodo(j)
 
     def count(self, task: str, pos: Position = None, city_id: str = "") -> int:
         """
@@ -168,7 +258,7 @@ class JobBoard:
             job.unit_id = unit.id
             job.isNew = True
             job.subtask = 0
-            self.inprogress[unit.id] = job
+            self._addInprogress(job)
             return job
 #        elif self.parent.time < 15:
 #            if self.parent.time % 2: 
@@ -184,23 +274,24 @@ class JobBoard:
 #            job = Job(Task.HARVEST, unit.pos)
             job.isNew = True
             job.unit_id = unit.id
-            self.inprogress[unit.id] = job
+            self._addInprogress(job)
             return job
         
     def jobDone(self, unit_id):
-        job = self.inprogress.get(unit_id)
-        if job:
-            self.done.append(job)
-            del self.inprogress[unit_id]
+        if unit_id in self.inprogress:
+            self.done.append(self._delInprogress(unit_id))
 
     def jobDrop(self, unit_id):
-        job = self.inprogress.get(unit_id)
-        if job:
-            del self.inprogress[unit_id]
+        if unit_id in self.inprogress:
+            self._delInprogress(unit_id)
 
 
     def activeJobToPos(self, pos: Position) -> bool:
-        return pos in [j.pos for j in self.inprogress.values()]
+        return pos in self._inprogress_pos
+
+    def activeJobPositions(self):
+        """ Positions of the inprogress jobs (live view, for 'in' tests) """
+        return self._inprogress_pos.keys()
 
     def checkActiveJobs(self, units : List, cities : List):
         """ 
@@ -213,17 +304,45 @@ class JobBoard:
             city no more on the list (destroyed city). In that case:
             - drop (remove) that job 
         """
-        morgue = []
-        for unit_id in self.inprogress:
-            if unit_id not in [u.id for u in units]:
-                morgue.append(unit_id)
+        unit_ids = {u.id for u in units}
+        morgue = [unit_id for unit_id in self.inprogress if unit_id not in unit_ids]
         for unit_id in morgue:
             # mov job to self.todo
             self.jobDrop(unit_id)
             # add unit_id in self.rip
             self.rip.append(unit_id)
-        # Create a new self.todo array removing jobs created by destroyed cities
-        self.todo = [j for j in self.todo if (not j.city_id) or j.city_id in cities]
-        # Create a new self.inprogress array removing jobs created by destroyed cities
-        self.inprogress = {k:v for k,v in self.inprogress.items() if (not v.city_id) or v.city_id in cities}
+        # Remove from self.todo the jobs created by destroyed cities
+        for i in reversed(range(len(self.todo))):
+            j = self.todo[i]
+            if j.city_id and j.city_id not in cities:
+                self._popTodo(i)
+        # Remove from self.inprogress the jobs created by destroyed cities
+        for unit_id in [k for k, v in self.inprogress.items() if v.city_id and v.city_id not in cities]:
+            self._delInprogress(unit_id)
         
+
+    def handleEvents(self, events : List, team : int):
+        """
+        Same of checkActiveJobs, driven by the events of the update (see
+        lux.game.Game.events) instead of scanning all the units and cities.
+        Only the events of 'team' are considered.
+        """
+        dead = set()
+        destroyed = set()
+        for event in events:
+            if event.team != team:
+                continue
+            if event.kind == Event.UNIT_DIED:
+                dead.add(event.id)
+            elif event.kind == Event.CITY_DESTROYED:
+                destroyed.add(event.id)
+        if dead:
+            for unit_id in [unit_id for unit_id in self.inprogress if unit_id in dead]:
+                self.jobDrop(unit_id)
+                self.rip.append(unit_id)
+        if destroyed:
+            for i in reversed(range(len(self.todo))):
+                if self.todo[i].city_id in destroyed:
+                    self._popTodo(i)
+            for unit_id in [k for k, v in self.inprogress.items() if v.city_id in destroyed]:
+                self._delInprogress(unit_id)
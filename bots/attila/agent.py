@@ -30,18 +30,8 @@ MAX_CITY_SIZE = 3
 DISTANCE_BETWEEN_CITIES = 2
         
 def find_closest_city_tile(pos, player):
-    closest_city_tile = None
-    if len(player.cities) > 0:
-        closest_dist = math.inf
-        # the cities are stored as a dictionary mapping city id to the city object, which has a citytiles field that
-        # contains the information of all citytiles in that city
-        for k, city in player.cities.items():
-            for city_tile in city.citytiles:
-                dist = city_tile.pos.distance_to(pos)
-                if dist < closest_dist:
-                    closest_dist = dist
-                    closest_city_tile = city_tile
-    return closest_city_tile
+    # nearest tile query on the citytiles of the player, kept up to date by each update
+    return player.city_tile_index.nearest(pos)
 
 
 def can_build_worker(player) -> int:
@@ -179,16 +169,17 @@ def agent(observation, configuration, DEBUG=False):
                     not game_state.map.get_cell_by_pos(unit.pos).citytile: 
                         actions.stay(unit)  # stay in the same position
                 else:   # find a new resource position
+                    path = None
                     if unit.pos == my_job.pos:
-                        tile = game_state.find_closest_resources(unit.pos)
-                        if not tile:    # no more resources to harvest
+                        move = game_state.find_resource_path(unit.pos)
+                        if not move.path:    # no more resources to harvest
                             actions.stay(unit)  # stay in the same position
                             jobs.jobDrop(unit.id)
                         else: # move to resource
-                            my_job.pos = tile.pos
+                            my_job.pos = Position.at(move.path[-1][1], move.path[-1][2])
+                            path = move.path
                     if unit.pos != my_job.pos:
-                        move = unit.pos.path_to(my_job.pos, game_state.map, playerid=game_state.id)
-                        if not actions.move(unit, move.direction): # cannot move to a resource tile
+                        if not actions.move_to(unit, my_job.pos, playerid=game_state.id, job=my_job, path=path): # cannot move to a resource tile
                                 jobs.jobReject(unit.id)
                 if unit.get_cargo_space_left() == 0:
                     actions.stay(unit)
@@ -207,26 +198,25 @@ def agent(observation, configuration, DEBUG=False):
                         my_job.subtask = 1
                     elif (game_state.map.get_cell_by_pos(unit.pos).citytile or 
                         game_state.getEnergy(unit.pos.x, unit.pos.y) == 0 ):
-                        tile = game_state.find_closest_resources(unit.pos)
-                        if not tile:
+                        move = game_state.find_resource_path(unit.pos)
+                        if not move.path:
                             actions.stay(unit)  # stay in the same position
                             jobs.jobReject(unit.id)
                         else: 
-                            move = unit.pos.path_to(tile.pos, game_state.map, playerid=game_state.id)
-                            if not actions.move(unit, move.direction): # cannot move to a resource tile
+                            resource = Position.at(move.path[-1][1], move.path[-1][2])
+                            if not actions.move_to(unit, resource, playerid=game_state.id, path=move.path): # cannot move to a resource tile
                                 jobs.jobReject(unit.id)
                 if my_job.subtask == 1: # go to citytile
                     if unit.pos == my_job.pos:
                         actions.stay(unit)  # stay in the same position
                         ct = game_state.map.get_cell_by_pos(unit.pos).citytile
-                        if ct:
+                        if ct and ct.team == game_state.id:
                             if player.cities[ct.cityid].isFulled():
                                 jobs.jobDone(unit.id)
                         else:
                             jobs.jobDone(unit.id)
                     else:                
-                        move = unit.pos.path_to(my_job.pos, game_state.map, playerid=game_state.id)
-                        if not actions.move(unit, move.direction):
+                        if not actions.move_to(unit, my_job.pos, playerid=game_state.id, job=my_job):
                             jobs.jobReject(unit.id)
 
             elif my_job.task == Task.BUILD:
@@ -235,13 +225,13 @@ def agent(observation, configuration, DEBUG=False):
                         my_job.subtask = 1
                     elif (game_state.map.get_cell_by_pos(unit.pos).citytile or 
                         game_state.getEnergy(unit.pos.x, unit.pos.y) == 0 ):
-                        tile = game_state.find_closest_resources(unit.pos)
-                        if not tile:    # no reacheable resource
+                        move = game_state.find_resource_path(unit.pos)
+                        if not move.path:    # no reacheable resource
                             actions.stay(unit)  # stay in the same position
                             jobs.jobDrop(unit.id)
                         else: 
-                            move = unit.pos.path_to(tile.pos, game_state.map, playerid=game_state.id)
-                            if not actions.move(unit, move.direction):
+                            resource = Position.at(move.path[-1][1], move.path[-1][2])
+                            if not actions.move_to(unit, resource, playerid=game_state.id, path=move.path):
                                 jobs.jobDrop(unit.id)
                 if my_job.subtask == 1: # Go to Build position
                     if unit.pos == my_job.pos:
@@ -252,7 +242,7 @@ def agent(observation, configuration, DEBUG=False):
                             actions.build_city(unit)
                             my_job.subtask = 2
                     else:
-                        move = unit.pos.path_to(my_job.pos, game_state.map, noCities=True)
+                        move = game_state.jobPath(unit, my_job, noCities=True)
                         if move.path:
                             if not actions.move(unit, move.direction):
                                 jobs.jobDrop(unit.id)
@@ -290,8 +280,14 @@ def agent(observation, configuration, DEBUG=False):
                         pos = player.cities[my_job.city_id].citytiles[0].pos
                     else:
                         pos = my_job.pos
-                    explore_pos = game_state.getClosestExploreTarget(pos, min_distance=DISTANCE_BETWEEN_CITIES)
-                    if explore_pos:
+                    # targets of the other units and resource clusters with
+                    # a worker for each cell are skipped
+                    exclude = jobs.activeJobPositions() | game_state.crowdedClusterCells()
+                    explore_pos = game_state.getClosestExploreTarget(pos, min_distance=DISTANCE_BETWEEN_CITIES,
+                                                                     exclude=exclude)
+                    # by day no trips that can't be finished before the night,
+                    # at night the trip has to be safe (see safePath below)
+                    if explore_pos and (game_state.isNight() or game_state.canArriveBeforeNight(unit, explore_pos)):
                         my_job.subtask = 1  # HARVEST resource from position
                         my_job.pos = explore_pos
                     else:
@@ -312,7 +308,15 @@ def agent(observation, configuration, DEBUG=False):
                             my_job.subtask = 2  # BUILD A NEW CITY
                     else:
                         # move_dir = unit.pos.direction_to(my_job.pos)
-                        move = unit.pos.path_to(my_job.pos, game_state.map, playerid=game_state.id)
+                        if game_state.isNight():
+                            # only the trips the unit can survive with its cargo
+                            move = game_state.safePath(unit, my_job.pos)
+                            if not move.path:
+                                actions.stay(unit)
+                                jobs.jobDrop(unit.id)
+                                continue
+                        else:
+                            move = game_state.jobPath(unit, my_job, playerid=game_state.id, astar=True)
                         if not actions.move(unit, move.direction):
                             # jobs.jobReject(unit.id)
                             jobs.jobDrop(unit.id)
@@ -323,8 +327,7 @@ def agent(observation, configuration, DEBUG=False):
                         my_job.subtask = 3 # ENERGIZE CITY
                     else:
                         #move_dir = unit.pos.direction_to(my_job.pos)
-                        move = unit.pos.path_to(my_job.pos, game_state.map, noCities=True, playerid=game_state.id)
-                        if not actions.move(unit, move.direction):
+                        if not actions.move_to(unit, my_job.pos, noCities=True, playerid=game_state.id, job=my_job):
                             action = unit.build_city()
                             # jobs.jobReject(unit.id) 
                             jobs.jobDrop(unit.id)   
@@ -336,7 +339,7 @@ def agent(observation, configuration, DEBUG=False):
             elif my_job.task == Task.INVASION:
                 if my_job.subtask == 0: 
                     # get an invasion target position
-                    target_pos = game_state.getClosestInvasionTarget(unit.pos)                    
+                    target_pos = game_state.getClosestInvasionTarget(unit.pos, exclude=jobs.activeJobPositions())
                     if not target_pos:
                         actions.stay(unit)
                         jobs.jobDone(unit.id)
@@ -372,15 +375,14 @@ def agent(observation, configuration, DEBUG=False):
                             actions.stay(unit)  # stay untill cargo is fulled
                     else:
                         # move_dir = unit.pos.direction_to(my_job.pos)
-                        move = unit.pos.path_to(my_job.pos, game_state.map, playerid=game_state.id)
-                        if not actions.move(unit, move.direction):  # no way to move
+                        if not actions.move_to(unit, my_job.pos, playerid=game_state.id, job=my_job):  # no way to move
                             jobs.jobDrop(unit.id)
                 if my_job.subtask == 2: # BUILD A NEW CITY
                     if unit.pos == my_job.pos:
                         actions.build_city(unit)
                         jobs.jobDone(unit.id)
                     else:
-                        move = unit.pos.path_to(my_job.pos, game_state.map, noCities=True, playerid=game_state.id)
+                        move = game_state.jobPath(unit, my_job, noCities=True, playerid=game_state.id, astar=True)
                         if not actions.move(unit, move.direction):
                             if unit.get_cargo_space_left() == 0 and not game_state.map.get_cell_by_pos(unit.pos).has_resource:
                                 actions.build_city(unit)
@@ -0,0 +1,272 @@
+import numpy as np
+
+from .constants import Constants
+from .game_map import GameMap, Cell, Resource, Position
+
+RESOURCE_TYPES = Constants.RESOURCE_TYPES
+
+# codes used in ArrayGameMap.resource_type
+NO_RESOURCE = 0
+RESOURCE_CODES = {
+    RESOURCE_TYPES.WOOD: 1,
+    RESOURCE_TYPES.COAL: 2,
+    RESOURCE_TYPES.URANIUM: 3,
+}
+RESOURCE_NAMES = [None, RESOURCE_TYPES.WOOD, RESOURCE_TYPES.COAL, RESOURCE_TYPES.URANIUM]
+
+NO_UNITS = ()
+
+# names of the ArrayGameMap arrays, same order of ArrayGameMap._arrays
+ARRAYS = ("resource_type", "resource_amount", "citytile_team", "citytile_id", "units", "road")
+
+
+def city_number(cityid: str) -> int:
+    """ 'c_12' -> 12 """
+    return int(cityid[2:])
+
+
+class CellView(Cell):
+    """
+    Read only view of a cell of an ArrayGameMap, same interface of Cell
+    """
+    __slots__ = ("_map",)
+
+    def __init__(self, game_map, x, y):
+        self._map = game_map
+        self.pos = Position.at(x, y)
+
+    def __reduce__(self):
+        # the cell fields are properties on the arrays of the map
+        return CellView, (self._map, self.pos.x, self.pos.y)
+
+    @property
+    def resource(self) -> Resource:
+        x, y = self.pos.x, self.pos.y
+        code = self._map.resource_type[y, x]
+        if code == NO_RESOURCE:
+            return None
+        return Resource(RESOURCE_NAMES[code], int(self._map.resource_amount[y, x]))
+
+    @property
+    def citytile(self):
+        return self._map._citytile_objs.get((self.pos.x, self.pos.y))
+
+    @property
+    def road(self):
+        return float(self._map.road[self.pos.y, self.pos.x])
+
+    @property
+    def units(self):
+        return self._map._unit_lists.get((self.pos.x, self.pos.y), NO_UNITS)
+
+    def has_resource(self):
+        x, y = self.pos.x, self.pos.y
+        return bool(self._map.resource_type[y, x] != NO_RESOURCE and self._map.resource_amount[y, x] > 0)
+
+
+class ArrayGameMap(GameMap):
+    """
+    GameMap with a structure of arrays backend: every cell field is stored
+    in a (height, width) NumPy array indexed by [y, x].
+    - resource_type   : NO_RESOURCE or one of RESOURCE_CODES
+    - resource_amount : amount of the resource
+    - citytile_team   : team of the citytile, -1 if none
+    - citytile_id     : number of the city ('c_12' -> 12), -1 if none
+    - units           : number of units in the cell
+    - road            : road level
+    Cells returned by get_cell / get_cell_by_pos are CellView on the arrays.
+
+    The arrays of a finished update are never written again: each update
+    writes new arrays, so copies of the map (see copy) can share them.
+    """
+
+    def __init__(self, width, height):
+        self.height = height
+        self.width = width
+        self._new_arrays()
+        self._citytile_objs = {}    # (x, y): CityTile
+        self._unit_lists = {}       # (x, y): [Unit, ...]
+        self.map = [[CellView(self, x, y) for x in range(width)] for y in range(height)]
+        self.dirty = {(x, y) for x in range(width) for y in range(height)}
+        self.changed = set(ARRAYS)  # names of the arrays changed by the last update
+        self._fresh = True
+        self._shared = False    # arrays and dicts shared with a copy
+        self._clear_search_cache()
+
+    def __getattr__(self, name):
+        # the cells of a copy are created on first use
+        if name == "map":
+            self.map = [[CellView(self, x, y) for x in range(self.width)] for y in range(self.height)]
+            return self.map
+        raise AttributeError(name)
+
+    def _new_arrays(self):
+        height, width = self.height, self.width
+        self.resource_type = np.zeros((height, width), dtype=np.int8)
+        self.resource_amount = np.zeros((height, width), dtype=np.int32)
+        self.citytile_team = np.full((height, width), -1, dtype=np.int8)
+        self.citytile_id = np.full((height, width), -1, dtype=np.int32)
+        self.units = np.zeros((height, width), dtype=np.int8)
+        self.road = np.zeros((height, width), dtype=np.float32)
+
+    def _arrays(self):
+        return (self.resource_type, self.resource_amount, self.citytile_team,
+                self.citytile_id, self.units, self.road)
+
+    def copy(self) -> 'ArrayGameMap':
+        """
+        Copy-on-write copy of the map: arrays and cell contents are shared
+        until one of the two maps is written
+        """
+        game_map = ArrayGameMap.__new__(ArrayGameMap)
+        game_map.height = self.height
+        game_map.width = self.width
+        (game_map.resource_type, game_map.resource_amount, game_map.citytile_team,
+         game_map.citytile_id, game_map.units, game_map.road) = self._arrays()
+        game_map._citytile_objs = self._citytile_objs
+        game_map._unit_lists = self._unit_lists
+        game_map.dirty = set(self.dirty)
+        game_map.changed = set(self.changed)
+        game_map._fresh = self._fresh
+        game_map._shared = self._shared = True
+        game_map._passable_cache = dict(self._passable_cache)
+        game_map._field_cache = dict(self._field_cache)
+        game_map._cooldown_cache = dict(self._cooldown_cache)
+        return game_map
+
+    def _unshare(self):
+        """
+        Copy of the shared arrays and dicts, before writing them
+        """
+        (self.resource_type, self.resource_amount, self.citytile_team,
+         self.citytile_id, self.units, self.road) = [a.copy() for a in self._arrays()]
+        self._citytile_objs = dict(self._citytile_objs)
+        self._unit_lists = {xy: list(units) for xy, units in self._unit_lists.items()}
+        self._shared = False
+        self._clear_search_cache()
+
+    def _passable(self, noCities, noResources, playerid):
+        """
+        Cells a unit can enter, flat list indexed by y * width + x, cached
+        until the next update (see Position.path_to for the parameters)
+        """
+        key = (noCities, noResources, playerid)
+        passable = self._passable_cache.get(key)
+        if passable is None:
+            team = self.citytile_team
+            if noCities or playerid is None:
+                blocked = team >= 0
+            else:
+                blocked = (team >= 0) & (team != playerid)
+            if noResources:
+                blocked |= self.resource_type != NO_RESOURCE
+            blocked |= self.units > 0
+            passable = self._passable_cache[key] = (~blocked).ravel().tolist()
+        return passable
+
+    def _obstacles(self, playerid):
+        """
+        Cells a unit of playerid can never enter while the map stays the
+        same (units aside): the citytiles of the other team, flat list
+        indexed by y * width + x
+        """
+        team = self.citytile_team
+        return ((team >= 0) & (team != playerid)).ravel().tolist()
+
+    def _cooldowns(self, cooldown):
+        """
+        Cooldown of a unit in each cell, reduced by the road level (at least
+        1 turn), flat list indexed by y * width + x, cached until the next
+        update
+        """
+        cooldowns = self._cooldown_cache.get(cooldown)
+        if cooldowns is None:
+            cooldowns = self._cooldown_cache[cooldown] = \
+                np.maximum(1, cooldown - self.road).ravel().tolist()
+        return cooldowns
+
+    def _setResource(self, r_type, x, y, amount):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        if self._shared:
+            self._unshare()
+        self.resource_type[y, x] = RESOURCE_CODES[r_type]
+        self.resource_amount[y, x] = amount
+
+    def _setResources(self, r_types, xs, ys, amounts):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        if self._shared:
+            self._unshare()
+        self.resource_type[ys, xs] = list(map(RESOURCE_CODES.__getitem__, r_types))
+        self.resource_amount[ys, xs] = amounts
+
+    def _setCityTile(self, x, y, citytile):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        if self._shared:
+            self._unshare()
+        self.citytile_team[y, x] = citytile.team
+        self.citytile_id[y, x] = city_number(citytile.cityid)
+        self._citytile_objs[x, y] = citytile
+
+    def _setRoad(self, x, y, road):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        if self._shared:
+            self._unshare()
+        self.road[y, x] = road
+
+    def _addUnit(self, x, y, unit):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        if self._shared:
+            self._unshare()
+        self.units[y, x] += 1
+        units = self._unit_lists.get((x, y))
+        if units is None:
+            self._unit_lists[x, y] = [unit]
+        else:
+            units.append(unit)
+
+    def _begin_update(self):
+        """
+        Start of an incremental update: arrays of the previous turn are kept
+        to compute the dirty cells in '_end_update'
+        """
+        self._previous = self._arrays()
+        self._old_unit_lists = self._unit_lists
+        self._new_arrays()
+        self._citytile_objs = {}
+        self._unit_lists = {}
+        self._shared = False
+        self._clear_search_cache()
+
+    def _end_update(self):
+        """
+        End of an incremental update: fills 'dirty' with all the changed cells
+        """
+        if not self._fresh:
+            changed = np.zeros((self.height, self.width), dtype=bool)
+            self.changed = set()
+            for name, old, new in zip(ARRAYS, self._previous, self._arrays()):
+                diff = old != new
+                if diff.any():
+                    changed |= diff
+                    self.changed.add(name)
+            ys, xs = np.nonzero(changed)
+            self.dirty = set(zip(xs.tolist(), ys.tolist()))
+            old_units = self._old_unit_lists
+            for xy in old_units.keys() | self._unit_lists.keys():
+                if xy not in self.dirty and \
+                    [u.id for u in old_units.get(xy, NO_UNITS)] != \
+                    [u.id for u in self._unit_lists.get(xy, NO_UNITS)]:
+                    self.dirty.add(xy)
+        self._previous = None
+        self._old_unit_lists = None
+        self._fresh = False
@@ -1,11 +1,50 @@
+import copy
+from collections import namedtuple
+
 from .constants import Constants
 from .game_map import GameMap
 from .game_objects import Player, Unit, City, CityTile
+from .pathfinding import DistanceTable, get_path_finder
 
 INPUT_CONSTANTS = Constants.INPUT_CONSTANTS
 
 
+class Event:
+    """
+    Kinds of the changes found by an update (see Game.events)
+    """
+    UNIT_SPAWNED = "unit_spawned"       # obj: Unit
+    UNIT_MOVED = "unit_moved"           # obj: Unit, data: previous Position
+    UNIT_DIED = "unit_died"             # obj: Unit (state of its last turn)
+    CITY_FOUNDED = "city_founded"       # obj: City
+    CITY_GREW = "city_grew"             # obj: City, data: previous number of citytiles
+    CITY_DESTROYED = "city_destroyed"   # obj: City (state of its last turn)
+
+
+# kind: one of Event, team: team of obj, id: unit id or city id
+GameEvent = namedtuple("GameEvent", ["kind", "team", "id", "obj", "data"])
+
+
 class Game:
+    def __init__(self, incremental=False, map_class=GameMap, distances=False):
+        """
+        incremental : keep the GameMap alive between turns and update only
+                      the changed cells (see GameMap.dirty)
+        map_class   : GameMap or a subclass with the same interface
+                      (ex: lux.array_map.ArrayGameMap)
+        distances   : keep in 'distances' the walking distances between all
+                      the cells for the units of this player (see
+                      lux.pathfinding.DistanceTable), built by the first
+                      update and computed again row by row after the
+                      citytiles of the other team change
+        """
+        self.incremental = incremental
+        self.map_class = map_class
+        self.use_distances = distances
+        self.distances = None
+        self.events = []    # GameEvent of the last update
+        self._shared = False    # units and cities shared with a snapshot
+
     def _initialize(self, messages):
         """
         initialize state
@@ -16,73 +55,198 @@ class Game:
         mapInfo = messages[1].split(" ")
         self.map_width = int(mapInfo[0])
         self.map_height = int(mapInfo[1])
-        self.map = GameMap(self.map_width, self.map_height)
+        self.map = self.map_class(self.map_width, self.map_height)
         self.players = [Player(0), Player(1)]
+        self.distances = None
+
+    def snapshot(self) -> 'Game':
+        """
+        Copy-on-write copy of the game state (map, players, units, cities).
+        The copy shares with this game the objects and indexes of the
+        players, the next update of each one copies or replaces them.
+        With ArrayGameMap the map arrays are shared too (see
+        ArrayGameMap.copy), GameMap.copy copies every cell instead.
+        Units, cities and citytiles objects are shared, do not change them
+        in the snapshot.
+        """
+        game = copy.copy(self)
+        game.map = self.map.copy()
+        game.players = [player._copy() for player in self.players]
+        # the next update of this game replaces the shared objects
+        self._shared = game._shared = True
+        return game
+
+    clone = snapshot
 
     def _end_turn(self):
         print("D_FINISH")
 
     def _reset_player_states(self):
-        self.players[0].units = []
-        self.players[0].cities = {}
-        self.players[0].city_tile_count = 0
-        self.players[1].units = []
-        self.players[1].cities = {}
-        self.players[1].city_tile_count = 0
+        # Unit and City objects live as long as their unit or city: the
+        # cities of the previous turn are kept to be updated in place
+        self._old_cities = []
+        for player in self.players:
+            self._old_cities.append(player.cities)
+            player.units = []
+            player.cities = {}
+            player.city_tile_count = 0
+            if self._shared:
+                player.unit_by_id = dict(player.unit_by_id)
+                player.city_tile_index = player.city_tile_index.copy()
+            player.city_tile_index._begin_update()
+
+    def _collect_events(self):
+        """
+        Removes the units, the cities and the citytiles not in the update
+        and adds the UNIT_DIED, CITY_GREW, CITY_DESTROYED events
+        """
+        events = self.events
+        for player, old_cities in zip(self.players, self._old_cities):
+            player.city_tile_index._end_update()
+            if len(player.unit_by_id) != len(player.units):
+                alive = {unit.id for unit in player.units}
+                for unit_id in [u for u in player.unit_by_id if u not in alive]:
+                    unit = player.unit_by_id.pop(unit_id)
+                    events.append(GameEvent(Event.UNIT_DIED, player.team, unit_id, unit, None))
+            for cityid, city in player.cities.items():
+                old = old_cities.get(cityid)
+                if old is not None:
+                    # updated in place or replaced (see snapshot)
+                    n_tiles = len(city._old_tiles) if old is city else len(old.citytiles)
+                    if len(city.citytiles) > n_tiles:
+                        events.append(GameEvent(Event.CITY_GREW, player.team, cityid, city, n_tiles))
+            for cityid, city in old_cities.items():
+                if cityid not in player.cities:
+                    events.append(GameEvent(Event.CITY_DESTROYED, player.team, cityid, city, None))
+        self._old_cities = None
+        self._shared = False
 
     def _update(self, messages):
         """
         update state
         """
-        self.map = GameMap(self.map_width, self.map_height)
+        if not self.incremental:
+            self.map = self.map_class(self.map_width, self.map_height)
+        self.map._begin_update()
         self.turn += 1
+        self.events = []
         self._reset_player_states()
 
+        # group the update lines by input identifier
+        groups = {}
         for update in messages:
-            if update == "D_DONE":
+            if update == INPUT_CONSTANTS.DONE:
                 break
-            strs = update.split(" ")
-            input_identifier = strs[0]
-            if input_identifier == INPUT_CONSTANTS.RESEARCH_POINTS:
-                team = int(strs[1])
-                self.players[team].research_points = int(strs[2])
-            elif input_identifier == INPUT_CONSTANTS.RESOURCES:
-                r_type = strs[1]
-                x = int(strs[2])
-                y = int(strs[3])
-                amt = int(float(strs[4]))
-                self.map._setResource(r_type, x, y, amt)
-            elif input_identifier == INPUT_CONSTANTS.UNITS:
-                unittype = int(strs[1])
-                team = int(strs[2])
-                unitid = strs[3]
-                x = int(strs[4])
-                y = int(strs[5])
-                cooldown = float(strs[6])
-                wood = int(strs[7])
-                coal = int(strs[8])
-                uranium = int(strs[9])
+            input_identifier = update.partition(" ")[0]
+            rows = groups.get(input_identifier)
+            if rows is None:
+                groups[input_identifier] = [update]
+            else:
+                rows.append(update)
+        # then parse each group, cities must be parsed before their citytiles
+        for input_identifier, parser, n_fields in PARSERS:
+            rows = groups.get(input_identifier)
+            if rows:
+                parser(self, _fields(rows, input_identifier, n_fields), n_fields)
+        self._collect_events()
+        self.map._end_update()
+        if self.use_distances:
+            obstacles = self.map._obstacles(self.id)
+            if self.distances is None:
+                finder = get_path_finder(self.map_width, self.map_height)
+                self.distances = DistanceTable(finder, obstacles)
+            else:
+                self.distances = self.distances.updated(obstacles)
+
+    def _parse_research_points(self, strs, n):
+        for team, research_points in zip(map(int, strs[1::n]), map(int, strs[2::n])):
+            self.players[team].research_points = research_points
+
+    def _parse_resources(self, strs, n):
+        amts = strs[4::n]
+        try:
+            amts = list(map(int, amts))
+        except ValueError:  # some amounts are not integers
+            amts = [int(float(amt)) for amt in amts]
+        self.map._setResources(strs[1::n], list(map(int, strs[2::n])), list(map(int, strs[3::n])), amts)
+
+    def _parse_units(self, strs, n):
+        for unittype, team, unitid, x, y, cooldown, wood, coal, uranium in zip(
+                map(int, strs[1::n]), map(int, strs[2::n]), strs[3::n],
+                map(int, strs[4::n]), map(int, strs[5::n]), map(float, strs[6::n]),
+                map(int, strs[7::n]), map(int, strs[8::n]), map(int, strs[9::n])):
+            player = self.players[team]
+            unit = player.unit_by_id.get(unitid)
+            if unit is None:
                 unit = Unit(team, unittype, unitid, x, y, cooldown, wood, coal, uranium)
-                self.players[team].units.append(unit)
-                self.map.get_cell(x, y).units.append(unit)
-            elif input_identifier == INPUT_CONSTANTS.CITY:
-                team = int(strs[1])
-                cityid = strs[2]
-                fuel = float(strs[3])
-                lightupkeep = float(strs[4])
-                self.players[team].cities[cityid] = City(team, cityid, fuel, lightupkeep)
-            elif input_identifier == INPUT_CONSTANTS.CITY_TILES:
-                team = int(strs[1])
-                cityid = strs[2]
-                x = int(strs[3])
-                y = int(strs[4])
-                cooldown = float(strs[5])
-                city = self.players[team].cities[cityid]
-                citytile = city._add_city_tile(x, y, cooldown)
-                self.map.get_cell(x, y).citytile = citytile
-                self.players[team].city_tile_count += 1;
-            elif input_identifier == INPUT_CONSTANTS.ROADS:
-                x = int(strs[1])
-                y = int(strs[2])
-                road = float(strs[3])
-                self.map.get_cell(x, y).road = road
+                player.unit_by_id[unitid] = unit
+                self.events.append(GameEvent(Event.UNIT_SPAWNED, team, unitid, unit, None))
+            else:
+                pos = unit.pos
+                if self._shared:
+                    unit = Unit(team, unittype, unitid, x, y, cooldown, wood, coal, uranium)
+                    player.unit_by_id[unitid] = unit
+                else:
+                    unit._update(x, y, cooldown, wood, coal, uranium)
+                if unit.pos != pos:
+                    self.events.append(GameEvent(Event.UNIT_MOVED, team, unitid, unit, pos))
+            player.units.append(unit)
+            self.map._addUnit(x, y, unit)
+
+    def _parse_cities(self, strs, n):
+        for team, cityid, fuel, lightupkeep in zip(
+                map(int, strs[1::n]), strs[2::n], map(float, strs[3::n]), map(float, strs[4::n])):
+            city = self._old_cities[team].get(cityid)
+            if city is None:
+                city = City(team, cityid, fuel, lightupkeep)
+                self.events.append(GameEvent(Event.CITY_FOUNDED, team, cityid, city, None))
+            elif self._shared:
+                city = City(team, cityid, fuel, lightupkeep)
+            else:
+                city._update(fuel, lightupkeep)
+            self.players[team].cities[cityid] = city
+
+    def _parse_city_tiles(self, strs, n):
+        for team, cityid, x, y, cooldown in zip(
+                map(int, strs[1::n]), strs[2::n], map(int, strs[3::n]),
+                map(int, strs[4::n]), map(float, strs[5::n])):
+            player = self.players[team]
+            citytile = player.cities[cityid]._add_city_tile(x, y, cooldown)
+            self.map._setCityTile(x, y, citytile)
+            player.city_tile_index._add(citytile, player.city_tile_count)
+            player.city_tile_count += 1
+
+    def _parse_roads(self, strs, n):
+        for x, y, road in zip(map(int, strs[1::n]), map(int, strs[2::n]), map(float, strs[3::n])):
+            self.map._setRoad(x, y, road)
+
+
+def _fields(rows, input_identifier, n_fields):
+    """
+    Fields of the update lines of input_identifier: field i of each line is
+    strs[i::n_fields]. Fields are separated by any run of spaces, every line
+    must have at least n_fields (the ones after are ignored).
+    """
+    # split all the lines at once, each line starts with the identifier if
+    # none has more or less fields
+    strs = " ".join(rows).split()
+    if len(strs) == n_fields * len(rows) and strs[::n_fields].count(input_identifier) == len(rows):
+        return strs
+    strs = []
+    for row in rows:
+        fields = row.split()
+        if len(fields) < n_fields:
+            raise ValueError(f"update line with less than {n_fields} fields: {row!r}")
+        strs += fields[:n_fields]
+    return strs
+
+
+# (input identifier, parser, number of fields of the line) in parsing order
+PARSERS = [
+    (INPUT_CONSTANTS.RESEARCH_POINTS, Game._parse_research_points, 3),
+    (INPUT_CONSTANTS.RESOURCES, Game._parse_resources, 5),
+    (INPUT_CONSTANTS.UNITS, Game._parse_units, 10),
+    (INPUT_CONSTANTS.CITY, Game._parse_cities, 5),
+    (INPUT_CONSTANTS.CITY_TILES, Game._parse_city_tiles, 6),
+    (INPUT_CONSTANTS.ROADS, Game._parse_roads, 4),
+]
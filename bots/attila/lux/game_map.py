@@ -1,4 +1,6 @@
 import math
+import time
+from collections import namedtuple
 from typing import List, Tuple
 
 from .constants import Constants
@@ -6,19 +8,30 @@ from .constants import Constants
 DIRECTIONS = Constants.DIRECTIONS
 RESOURCE_TYPES = Constants.RESOURCE_TYPES
 
+MAX_MAP_SIZE = 32   # biggest map is 32x32, Position.at shares positions inside it
+
+# moves: unit id: Movement, searches: searches started by the batch (the
+# other requests reused one), time: seconds spent (see GameMap.plan_paths)
+PathBatch = namedtuple("PathBatch", ["moves", "requests", "searches", "time"])
+
 class Movement:
-    def __init__(self, direction, path):
+    def __init__(self, direction, path, arrival=None):
         self.direction = direction
         self.path = path
+        self.arrival = arrival  # turns to reach the target (only for paths in turns)
 
 class Resource:
+    __slots__ = ("type", "amount")
+
     def __init__(self, r_type: str, amount: int):
         self.type = r_type
         self.amount = amount
 
 class Cell:
+    __slots__ = ("pos", "resource", "citytile", "road", "units")
+
     def __init__(self, x, y):
-        self.pos = Position(x, y)
+        self.pos = Position.at(x, y)
         self.resource: Resource = None
         self.citytile = None
         self.road = 0
@@ -36,6 +49,16 @@ class GameMap:
             self.map[y] = [None] * width
             for x in range(0, self.width):
                 self.map[y][x] = Cell(x, y)
+        # cells (x, y) changed by the last update, a new map is all dirty
+        self.dirty = {(x, y) for x in range(width) for y in range(height)}
+        self._fresh = True
+        # cells written by the current update, one set for each cell field
+        self._resources = set()
+        self._citytiles = set()
+        self._roads = set()
+        self._units = set()
+        self._old_units = {}
+        self._clear_search_cache()
 
     def get_cell_by_pos(self, pos) -> Cell:
         return self.map[pos.y][pos.x]
@@ -43,23 +66,241 @@ class GameMap:
     def get_cell(self, x, y) -> Cell:
         return self.map[y][x]
 
+    def _clear_search_cache(self):
+        """
+        Drops the data of the path searches, to call when the cells change
+        """
+        self._passable_cache = {}   # (noCities, noResources, playerid): passable cells
+        self._field_cache = {}      # (target, noCities, noResources, playerid): DistanceField
+        self._cooldown_cache = {}   # unit cooldown: cooldown in each cell
+
+    def _passable(self, noCities, noResources, playerid) -> List[bool]:
+        """
+        Cells a unit can enter, flat list indexed by y * width + x, cached
+        until the next update (see Position.path_to for the parameters)
+        """
+        key = (noCities, noResources, playerid)
+        passable = self._passable_cache.get(key)
+        if passable is None:
+            passable = []
+            for row in self.map:
+                for cell in row:
+                    ct = cell.citytile
+                    passable.append(not ((ct and (noCities or not ct.team == playerid)) or
+                                         (noResources and cell.resource) or cell.units))
+            self._passable_cache[key] = passable
+        return passable
+
+    def _obstacles(self, playerid) -> List[bool]:
+        """
+        Cells a unit of playerid can never enter while the map stays the
+        same (units aside): the citytiles of the other team, flat list
+        indexed by y * width + x
+        """
+        return [bool(cell.citytile and cell.citytile.team != playerid) for row in self.map for cell in row]
+
+    def _cooldowns(self, cooldown) -> List[float]:
+        """
+        Cooldown of a unit in each cell, reduced by the road level (at least
+        1 turn), flat list indexed by y * width + x, cached until the next
+        update
+        """
+        cooldowns = self._cooldown_cache.get(cooldown)
+        if cooldowns is None:
+            cooldowns = self._cooldown_cache[cooldown] = \
+                [max(1, cooldown - cell.road) for row in self.map for cell in row]
+        return cooldowns
+
+    def plan_paths(self, requests: List[Tuple]) -> PathBatch:
+        """
+        Paths of many units at once, requests are (unit, target, flags)
+        with flags the keyword arguments of Position.path_to (ex:
+        {"noCities": True, "playerid": 0}).
+        Requests with the same target and flags are answered by one search,
+        each search is done once for all its requests. A* and cooldown
+        requests are never shared and are answered one at a time.
+        """
+        from .pathfinding import get_path_finder
+        t = time.perf_counter()
+        finder = get_path_finder(self.width, self.height)
+        groups = {}
+        single = []
+        for unit, target, flags in requests:
+            if flags.get("astar") or flags.get("cooldown") is not None:
+                single.append((unit, target, flags))
+                continue
+            key = (target.x, target.y, flags.get("noCities", False), flags.get("noResources", False),
+                   flags.get("playerid"))
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [unit]
+            else:
+                group.append(unit)
+        moves = {}
+        misses = finder.misses
+        for (x, y, noCities, noResources, playerid), units in groups.items():
+            field = finder.target_field(x, y, self, noCities, noResources, playerid)
+            for unit in units:
+                moves[unit.id] = field.path(unit.pos.x, unit.pos.y)
+        searches = finder.misses - misses + len(single)
+        for unit, target, flags in single:
+            moves[unit.id] = unit.pos.path_to(target, self, **flags)
+        return PathBatch(moves, len(requests), searches, time.perf_counter() - t)
+
+    def copy(self) -> 'GameMap':
+        """
+        Copy of the map: cells are copied, their citytiles and units are shared
+        """
+        game_map = GameMap(self.width, self.height)
+        for row, new_row in zip(self.map, game_map.map):
+            for cell, new_cell in zip(row, new_row):
+                if cell.resource is not None:
+                    new_cell.resource = Resource(cell.resource.type, cell.resource.amount)
+                new_cell.citytile = cell.citytile
+                new_cell.road = cell.road
+                new_cell.units = list(cell.units)
+        game_map.dirty = set(self.dirty)
+        game_map._fresh = self._fresh
+        game_map._resources = set(self._resources)
+        game_map._citytiles = set(self._citytiles)
+        game_map._roads = set(self._roads)
+        game_map._units = set(self._units)
+        return game_map
+
     def _setResource(self, r_type, x, y, amount):
         """
         do not use this function, this is for internal tracking of state
         """
         cell = self.get_cell(x, y)
-        cell.resource = Resource(r_type, amount)
+        resource = cell.resource
+        if resource is None:
+            cell.resource = Resource(r_type, amount)
+            self.dirty.add((x, y))
+        elif resource.type != r_type or resource.amount != amount:
+            resource.type = r_type
+            resource.amount = amount
+            self.dirty.add((x, y))
+        self._resources.add((x, y))
+
+    def _setResources(self, r_types, xs, ys, amounts):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        for r_type, x, y, amount in zip(r_types, xs, ys, amounts):
+            self._setResource(r_type, x, y, amount)
+
+    def _setCityTile(self, x, y, citytile):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        cell = self.get_cell(x, y)
+        old = cell.citytile
+        if old is None or old.team != citytile.team or old.cityid != citytile.cityid:
+            self.dirty.add((x, y))
+        cell.citytile = citytile
+        self._citytiles.add((x, y))
+
+    def _setRoad(self, x, y, road):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        cell = self.get_cell(x, y)
+        if cell.road != road:
+            cell.road = road
+            self.dirty.add((x, y))
+        self._roads.add((x, y))
+
+    def _addUnit(self, x, y, unit):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        self.get_cell(x, y).units.append(unit)
+        self._units.add((x, y))
+
+    def _begin_update(self):
+        """
+        Start of an incremental update: the cells are kept alive and only the
+        ones written by the previous update are checked by '_end_update'
+        """
+        if not self._fresh:
+            self.dirty = set()
+        self._clear_search_cache()
+        self._old_resources, self._resources = self._resources, set()
+        self._old_citytiles, self._citytiles = self._citytiles, set()
+        self._old_roads, self._roads = self._roads, set()
+        self._old_units = {}
+        for x, y in self._units:
+            cell = self.map[y][x]
+            self._old_units[x, y] = cell.units
+            cell.units = []
+        self._units = set()
+
+    def _end_update(self):
+        """
+        End of an incremental update: resets the cells not written by this
+        update and fills 'dirty' with all the changed cells
+        """
+        for x, y in self._old_resources - self._resources:
+            self.map[y][x].resource = None
+            self.dirty.add((x, y))
+        for x, y in self._old_citytiles - self._citytiles:
+            self.map[y][x].citytile = None
+            self.dirty.add((x, y))
+        for x, y in self._old_roads - self._roads:
+            self.map[y][x].road = 0
+            self.dirty.add((x, y))
+        for (x, y), units in self._old_units.items():
+            if [u.id for u in units] != [u.id for u in self.map[y][x].units]:
+                self.dirty.add((x, y))
+        for x, y in self._units - self._old_units.keys():
+            self.dirty.add((x, y))
+        self._old_units = {}
+        self._fresh = False
 
 
 class Position:
+    """
+    Immutable and hashable map position, can be used as dict key or set member
+    """
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
-        self.x = x
-        self.y = y
+        object.__setattr__(self, "x", x)
+        object.__setattr__(self, "y", y)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Position is immutable")
+
+    # immutable: copies are the same instance, pickle through __init__
+    def __copy__(self) -> 'Position':
+        return self
+
+    def __deepcopy__(self, memo) -> 'Position':
+        return self
+
+    def __reduce__(self):
+        return Position, (self.x, self.y)
+
+    def __hash__(self) -> int:
+        # packed coordinates, unique for the positions of any map
+        return (self.x << 17) ^ self.y
+
+    @staticmethod
+    def at(x, y) -> 'Position':
+        """
+        Flyweight Position: the same instance is returned for each on-map
+        coordinate
+        """
+        if 0 <= x < MAX_MAP_SIZE and 0 <= y < MAX_MAP_SIZE:
+            return POSITIONS[y][x]
+        return Position(x, y)
 
     def __sub__(self, pos) -> int:
         return abs(pos.x - self.x) + abs(pos.y - self.y)
 
     def __eq__(self, pos) -> bool:
+        if not isinstance(pos, Position):
+            return NotImplemented
         return self.x == pos.x and self.y == pos.y
 
     def __str__(self) -> str:
@@ -79,21 +320,21 @@ class Position:
 
     def translate(self, direction, units) -> 'Position':
         if direction == DIRECTIONS.NORTH:
-            return Position(self.x, self.y - units)
+            return Position.at(self.x, self.y - units)
         elif direction == DIRECTIONS.EAST:
-            return Position(self.x + units, self.y)
+            return Position.at(self.x + units, self.y)
         elif direction == DIRECTIONS.SOUTH:
-            return Position(self.x, self.y + units)
+            return Position.at(self.x, self.y + units)
         elif direction == DIRECTIONS.WEST:
-            return Position(self.x - units, self.y)
+            return Position.at(self.x - units, self.y)
         elif direction == DIRECTIONS.CENTER:
-            return Position(self.x, self.y)
+            return self
 
     def halfway(self, target_pos: 'Position') -> 'Position':
         """
         Return position in between this and target_pos
         """
-        return Position((self.x + target_pos.x) // 2, (self.y + target_pos.y) // 2)
+        return Position.at((self.x + target_pos.x) // 2, (self.y + target_pos.y) // 2)
 
     def direction_to(self, target_pos: 'Position') -> DIRECTIONS:
         """
@@ -115,79 +356,34 @@ class Position:
                 closest_dist = dist
         return closest_dir
 
-    def path_to(self, target_pos: 'Position', map: GameMap, noCities=False, noResources=False, playerid = None) -> DIRECTIONS:
+    def path_to(self, target_pos: 'Position', map: GameMap, noCities=False, noResources=False, playerid = None,
+                astar=False, cooldown=None) -> DIRECTIONS:
         """ 
         Pathfinding : returns a direction of movement 
         -----
-        Using the Dijkstra's algorithm
+        Breadth first search from target_pos (see lux.pathfinding), a cell
+        can not be entered if it has units, a citytile not of playerid
+        (any citytile with noCities), a resource (only with noResources).
+        The search from target_pos is kept until the next update of the map
+        and resumed by the next path_to with the same target and parameters.
+        With astar the search is an A* guided by the distance to this
+        position: a path of the same length, expanding fewer cells on long
+        paths, but never cached.
+        With cooldown (the unit base cooldown, see UNIT_ACTION_COOLDOWN) the
+        path is the one of the fewest turns, with the roads reducing the
+        cooldown (Dijkstra's algorithm, never cached): the distances of
+        the path are in turns and Movement.arrival is the turns to reach
+        target_pos for a unit that can act now.
         """
+        from .pathfinding import get_path_finder
+        finder = get_path_finder(map.width, map.height)
+        if cooldown is not None:
+            passable = map._passable(noCities, noResources, playerid)
+            return finder.dijkstra(target_pos.x, target_pos.y, self.x, self.y, passable, map._cooldowns(cooldown))
+        if astar:
+            passable = map._passable(noCities, noResources, playerid)
+            return finder.astar(target_pos.x, target_pos.y, self.x, self.y, passable)
+        return finder.path(target_pos.x, target_pos.y, self.x, self.y, map, noCities, noResources, playerid)
 
-        check_dirs = [
-            DIRECTIONS.NORTH,
-            DIRECTIONS.EAST,
-            DIRECTIONS.SOUTH,
-            DIRECTIONS.WEST
-        ]
 
-        path: List[Tuple] = []
-        spos = target_pos
-        epos = self
-        open_list = [(spos.x, spos.y)]
-        board = {(x, y): None for x in range(map.width)
-                for y in range(map.height)}
-
-        board[(spos.x, spos.y)] = 0
-
-        while open_list:
-            cur_pos = open_list.pop(0)
-            cur_cell = map.get_cell(cur_pos[0], cur_pos[1])
-            dist = board[(cur_cell.pos.x, cur_cell.pos.y)]
-            if cur_cell.pos.is_adjacent(epos):
-                board[(epos.x, epos.y)] = dist + 1
-                break
-            for direction in check_dirs:
-                next_pos = cur_cell.pos.translate(direction, 1)
-                if not 0 <= next_pos.x < map.width:
-                    continue
-                if not 0 <= next_pos.y < map.height:
-                    continue
-                next_cell = map.get_cell_by_pos(next_pos)
-                # check if CityTile
-                ct = next_cell.citytile
-                if ct and (noCities or not ct.team == playerid):
-                    continue
-                if noResources and next_cell.resource:
-                    continue
-                if next_cell.units:
-                    continue
-                if board[(next_cell.pos.x, next_cell.pos.y)] != None:
-                    continue
-                board[(next_cell.pos.x, next_cell.pos.y)] = dist + 1
-                open_list.append((next_cell.pos.x, next_cell.pos.y))
-        # return the path
-        dist = board[(epos.x, epos.y)]
-        if not dist:
-            # no path founded
-            return Movement(DIRECTIONS.CENTER, [])
-        cur_step = (DIRECTIONS.CENTER, epos.x, epos.y, dist)
-        path.append(cur_step)
-        dist -= 1
-        while dist >= 0:
-            for direction in check_dirs:
-                cur_pos = Position(cur_step[1], cur_step[2])
-                next_pos = cur_pos.translate(direction, 1)
-                if not 0 <= next_pos.x < map.width:
-                    continue
-                if not 0 <= next_pos.y < map.height:
-                    continue
-                if board[(next_pos.x, next_pos.y)] == dist:
-                    cur_step = (direction, next_pos.x, next_pos.y, dist)
-                    path.append(cur_step)
-                    dist -= 1
-                    break
-
-        if len(path) > 1:
-            direction = path[1][0]
-        else:
-            direction = path[0][0]
-        return Movement(direction, path)
+POSITIONS = [[Position(x, y) for x in range(MAX_MAP_SIZE)] for y in range(MAX_MAP_SIZE)]
@@ -1,7 +1,9 @@
+import copy
 from typing import Dict
 
 from .constants import Constants
 from .game_map import Position
+from .spatial import CityTileIndex
 from .game_constants import GAME_CONSTANTS
 
 UNIT_TYPES = Constants.UNIT_TYPES
@@ -14,6 +16,15 @@ class Player:
         self.units: list[Unit] = []
         self.cities: Dict[str, City] = {}
         self.city_tile_count = 0
+        self.unit_by_id: Dict[str, Unit] = {}   # all living units, kept between turns
+        self.city_tile_index = CityTileIndex()  # nearest citytile queries, patched by each update
+    def _copy(self) -> 'Player':
+        """
+        do not use this function, see Game.snapshot
+        """
+        # unit_by_id and city_tile_index are shared, the next update of each
+        # game copies them before changing them (see Game._reset_player_states)
+        return copy.copy(self)
     def researched_coal(self) -> bool:
         return self.research_points >= GAME_CONSTANTS["PARAMETERS"]["RESEARCH_REQUIREMENTS"]["COAL"]
     def researched_uranium(self) -> bool:
@@ -21,14 +32,29 @@ class Player:
 
 
 class City:
+    __slots__ = ("cityid", "team", "fuel", "citytiles", "light_upkeep", "_old_tiles")
+
     def __init__(self, teamid, cityid, fuel, light_upkeep):
         self.cityid = cityid
         self.team = teamid
         self.fuel = fuel
         self.citytiles: list[CityTile] = []
         self.light_upkeep = light_upkeep
+        self._old_tiles: Dict[Position, CityTile] = {}  # citytiles of the previous update
+    def _update(self, fuel, light_upkeep):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        self.fuel = fuel
+        self.light_upkeep = light_upkeep
+        self._old_tiles = {ct.pos: ct for ct in self.citytiles}
+        self.citytiles = []
     def _add_city_tile(self, x, y, cooldown):
-        ct = CityTile(self.team, self.cityid, x, y, cooldown)
+        ct = self._old_tiles.get(Position.at(x, y))
+        if ct is None:
+            ct = CityTile(self.team, self.cityid, x, y, cooldown)
+        else:
+            ct.cooldown = cooldown
         self.citytiles.append(ct)
         return ct
     def get_light_upkeep(self):
@@ -38,10 +64,12 @@ class City:
         return self.fuel > night_enegy_cost
 
 class CityTile:
+    __slots__ = ("cityid", "team", "pos", "cooldown")
+
     def __init__(self, teamid, cityid, x, y, cooldown):
         self.cityid = cityid
         self.team = teamid
-        self.pos = Position(x, y)
+        self.pos = Position.at(x, y)
         self.cooldown = cooldown
     def can_act(self) -> bool:
         """
@@ -66,6 +94,8 @@ class CityTile:
 
 
 class Cargo:
+    __slots__ = ("wood", "coal", "uranium")
+
     def __init__(self):
         self.wood = 0
         self.coal = 0
@@ -76,24 +106,31 @@ class Cargo:
 
 
 class Unit:
+    __slots__ = ("pos", "team", "id", "type", "cooldown", "cargo", "energy", "light_upkeep")
+
     def __init__(self, teamid, u_type, unitid, x, y, cooldown, wood, coal, uranium):
-        self.pos = Position(x, y)
         self.team = teamid
         self.id = unitid
         self.type = u_type
-        self.cooldown = cooldown
         self.cargo = Cargo()
+        if self.is_worker():
+            self.light_upkeep = GAME_CONSTANTS["PARAMETERS"]["LIGHT_UPKEEP"]["WORKER"]
+        if self.is_cart():
+            self.light_upkeep = GAME_CONSTANTS["PARAMETERS"]["LIGHT_UPKEEP"]["CART"]
+        self._update(x, y, cooldown, wood, coal, uranium)
+
+    def _update(self, x, y, cooldown, wood, coal, uranium):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        self.pos = Position.at(x, y)
+        self.cooldown = cooldown
         self.cargo.wood = wood
         self.cargo.coal = coal
         self.cargo.uranium = uranium
         self.energy =   self.cargo.wood * Constants.RESOURCE_TO_FUEL_RATE.WOOD + \
                         self.cargo.coal * Constants.RESOURCE_TO_FUEL_RATE.COAL + \
                         self.cargo.uranium * Constants.RESOURCE_TO_FUEL_RATE.URANIUM
-        if self.is_worker():
-            self.light_upkeep = GAME_CONSTANTS["PARAMETERS"]["LIGHT_UPKEEP"]["WORKER"]
-        if self.is_cart():
-            self.light_upkeep = GAME_CONSTANTS["PARAMETERS"]["LIGHT_UPKEEP"]["CART"]
-
 
     def is_worker(self) -> bool:
         return self.type == UNIT_TYPES.WORKER
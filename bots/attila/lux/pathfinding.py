@@ -0,0 +1,482 @@
+from heapq import heappush, heappop
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .constants import Constants
+from .game_map import Movement
+
+DIRECTIONS = Constants.DIRECTIONS
+
+# neighbors are always visited in this order
+CHECK_DIRS = [
+    (DIRECTIONS.NORTH, 0, -1),
+    (DIRECTIONS.EAST, 1, 0),
+    (DIRECTIONS.SOUTH, 0, 1),
+    (DIRECTIONS.WEST, -1, 0),
+]
+
+UNREACHED = -1
+NO_PATH = 32767     # DistanceTable distance of the unreachable cells
+
+
+class DistanceField:
+    """
+    Breadth first search from one or more target cells, expanded only as
+    far as the queries need: the search is suspended after each query and
+    resumed by the next one. Cells are indexed by y * width + x.
+    """
+    __slots__ = ("finder", "passable", "dist", "queue", "head")
+
+    def __init__(self, finder: 'PathFinder', targets: List[int], passable: List[bool]):
+        self.finder = finder
+        self.passable = passable
+        self.dist = [UNREACHED] * (finder.width * finder.height)   # distance from the closest target
+        self.queue = []         # each cell is queued at most once
+        self.head = 0           # next cell of the queue to expand
+        for target in targets:
+            if self.dist[target] == UNREACHED:
+                self.dist[target] = 0
+                self.queue.append(target)
+
+    def distance_from(self, e: int) -> int:
+        """
+        Distance of the path from cell e: 1 + distance of the closest cell
+        among e and its neighbors, UNREACHED if there is no path
+        """
+        dist = self.dist
+        around = self.finder.around[e]
+        queue = self.queue
+        neighbors = self.finder.neighbors
+        passable = self.passable
+        best = min([dist[n] for n in around if dist[n] != UNREACHED], default=None)
+        head = self.head
+        # all the cells closer than the head of the queue are already reached
+        while self.head < len(queue) and (best is None or dist[queue[self.head]] < best):
+            c = queue[self.head]
+            self.head += 1
+            d = dist[c] + 1
+            for n in neighbors[c]:
+                if passable[n] and dist[n] == UNREACHED:
+                    dist[n] = d
+                    queue.append(n)
+                    if n in around and (best is None or d < best):
+                        best = d
+        self.finder.expanded += self.head - head
+        return UNREACHED if best is None else best + 1
+
+    def distance(self, e: int) -> int:
+        """ Length of the path from cell e to the closest target, UNREACHED if none """
+        if self.dist[e] == 0:
+            return 0
+        return self.distance_from(e)
+
+    def path(self, ex, ey) -> Movement:
+        """
+        Path from (ex, ey) to the closest target, see Position.path_to.
+        The last step of the path is the target.
+        """
+        finder = self.finder
+        width = finder.width
+        e = ey * width + ex
+        if self.dist[e] == 0:
+            return Movement(DIRECTIONS.CENTER, [(DIRECTIONS.CENTER, ex, ey, 0)])
+        found = self.distance_from(e)
+        if found == UNREACHED:
+            # no path founded
+            return Movement(DIRECTIONS.CENTER, [])
+
+        # walk back to the target, first matching neighbor in CHECK_DIRS order
+        dist = self.dist
+        steps = finder.steps
+        path = [(DIRECTIONS.CENTER, ex, ey, found)]
+        c = e
+        k = found - 1
+        while k >= 0:
+            for direction, n in steps[c]:
+                if dist[n] == k:
+                    path.append((direction, n % width, n // width, k))
+                    c = n
+                    k -= 1
+                    break
+        if len(path) > 1:
+            direction = path[1][0]
+        else:
+            direction = path[0][0]
+        return Movement(direction, path)
+
+
+class PathFinder:
+    """
+    Neighbor tables of a width x height grid, shared by the DistanceField
+    of every map of that size.
+    - hits     : path queries answered by a cached DistanceField
+    - misses   : path queries that started a new DistanceField
+    - expanded : cells expanded by all the searches
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        # (direction, neighbor index) of each cell, in CHECK_DIRS order
+        self.steps: List[List[Tuple[str, int]]] = []
+        # neighbor indexes of each cell, in CHECK_DIRS order
+        self.neighbors: List[List[int]] = []
+        # the cell itself and its neighbors
+        self.around: List[frozenset] = []
+        for i in range(width * height):
+            x, y = i % width, i // width
+            steps = [(direction, (y + dy) * width + x + dx) for direction, dx, dy in CHECK_DIRS
+                     if 0 <= x + dx < width and 0 <= y + dy < height]
+            self.steps.append(steps)
+            self.neighbors.append([n for _, n in steps])
+            self.around.append(frozenset([i] + self.neighbors[-1]))
+        # direction of the step from a cell to its neighbor, by index difference
+        self.direction = {-width: DIRECTIONS.NORTH, 1: DIRECTIONS.EAST,
+                          width: DIRECTIONS.SOUTH, -1: DIRECTIONS.WEST}
+        # A* arrays: a cell value is valid only if its stamp is the current generation
+        size = width * height
+        self.cost = [0] * size          # cost of the best path from the target
+        self.parent = [0] * size        # previous cell of the best path
+        self.stamp = [0] * size         # generation of the search that reached the cell
+        self.closed = [0] * size        # generation of the search that expanded the cell
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.expanded = 0
+
+    def target_field(self, sx, sy, game_map, noCities, noResources, playerid) -> DistanceField:
+        """
+        Distance field of the target (sx, sy), kept by game_map until its
+        next update (see Position.path_to for the parameters)
+        """
+        key = (sy * self.width + sx, noCities, noResources, playerid)
+        field = game_map._field_cache.get(key)
+        if field is None:
+            self.misses += 1
+            field = DistanceField(self, [key[0]], game_map._passable(noCities, noResources, playerid))
+            game_map._field_cache[key] = field
+        else:
+            self.hits += 1
+        return field
+
+    def path(self, sx, sy, ex, ey, game_map, noCities, noResources, playerid) -> Movement:
+        """ Path from (ex, ey) to (sx, sy), see Position.path_to """
+        return self.target_field(sx, sy, game_map, noCities, noResources, playerid).path(ex, ey)
+
+    def field(self, targets: List[Tuple[int, int]], passable: List[bool]) -> DistanceField:
+        """
+        Search from all the targets (x, y) at once: the paths of the field
+        lead to the closest reachable target (not cached)
+        """
+        self.misses += 1
+        return DistanceField(self, [y * self.width + x for x, y in targets], passable)
+
+    def dijkstra(self, sx, sy, ex, ey, passable: List[bool], cooldown: List[float]) -> Movement:
+        """
+        Path from (ex, ey) to (sx, sy) of the fewest turns (not cached).
+        A unit entering a cell acts again int(cooldown[cell]) turns later
+        (when its cooldown is below 1, as in night_safe), the last move (into
+        the target) takes 1 turn. The search goes
+        from the target to (ex, ey), ties are broken by insertion order.
+        The steps of the path and Movement.arrival are in turns to target.
+        """
+        width = self.width
+        s = sy * width + sx
+        e = ey * width + ex
+        if s == e:
+            return Movement(DIRECTIONS.CENTER, [(DIRECTIONS.CENTER, ex, ey, 0)], 0)
+        self.generation += 1
+        generation = self.generation
+        cost = self.cost
+        parent = self.parent
+        stamp = self.stamp
+        closed = self.closed
+        neighbors = self.neighbors
+
+        stamp[s] = generation
+        cost[s] = 0
+        queue = [(0, 0, s)]
+        order = 1
+        while queue:
+            g, _, c = heappop(queue)
+            if closed[c] == generation:
+                continue
+            closed[c] = generation
+            self.expanded += 1
+            if c == e:
+                break
+            # turns from a neighbor to the target through c
+            g += 1 if c == s else int(cooldown[c])
+            for n in neighbors[c]:
+                if (passable[n] or n == e) and closed[n] != generation and \
+                        (stamp[n] != generation or g < cost[n]):
+                    stamp[n] = generation
+                    cost[n] = g
+                    parent[n] = c
+                    heappush(queue, (g, order, n))
+                    order += 1
+        if closed[e] != generation:
+            # no path founded
+            return Movement(DIRECTIONS.CENTER, [])
+
+        # follow the parents from (ex, ey) to the target
+        path = [(DIRECTIONS.CENTER, ex, ey, cost[e])]
+        c = e
+        while c != s:
+            n = parent[c]
+            path.append((self.direction[n - c], n % width, n // width, cost[n]))
+            c = n
+        return Movement(path[1][0], path, cost[e])
+
+    def night_safe(self, sx, sy, ex, ey, passable: List[bool], cooldown: List[float], shelter: List[bool],
+                   night: List[bool], fuel, upkeep, horizon, wait=0, income=0) -> Movement:
+        """
+        Path from (ex, ey) to (sx, sy) of the fewest turns for a unit with
+        'fuel' that burns 'upkeep' each night turn spent out of a shelter
+        (a citytile of its team). The states of the search are (cell, turn):
+        routes running out of fuel are dropped and the unit can wait in a
+        shelter for the night to end.
+        - night   : night[k] is True if turn k from now is a night turn,
+                    at least horizon + the night length turns
+        - horizon : last turn of the search, bounds its time
+        - wait    : turns before the unit can move, then it waits
+                    int(cooldown[cell]) turns after entering a cell (see
+                    dijkstra)
+        - income  : fuel gathered each turn at the target: there the unit
+                    must have the fuel for the rest of the night, net of
+                    the income
+        A cell is reached again at a later turn only with more fuel or with
+        a night turn in between. The steps of the path are (direction, x,
+        y, turns to target) and Movement.arrival is the turn of arrival.
+        """
+        width = self.width
+        s = sy * width + sx
+        e = ey * width + ex
+        neighbors = self.neighbors
+        if s == e:
+            return Movement(DIRECTIONS.CENTER, [(DIRECTIONS.CENTER, ex, ey, 0)], 0)
+        # night turns among the turns 1..k
+        nights = [0]
+        for k in range(1, len(night)):
+            nights.append(nights[-1] + night[k])
+
+        def burned(c, k0, k1):
+            # fuel burned in c from the turn after k0 to k1
+            return 0 if shelter[c] else upkeep * (nights[k1] - nights[k0])
+
+        # fuel needed at the target after the arrival at turn k
+        target_upkeep = 0 if shelter[s] else max(0, upkeep - income)
+
+        def needed(k):
+            n = 0
+            while k + 1 + n < len(night) and night[k + 1 + n]:
+                n += 1
+            return target_upkeep * n
+
+        def manhattan(c):
+            return abs(c % width - sx) + abs(c // width - sy)
+
+        fuel -= burned(e, 0, wait)
+        if fuel < 0 or wait + manhattan(e) > horizon:
+            return Movement(DIRECTIONS.CENTER, [])
+        layers = [{} for _ in range(horizon + 1)]   # turn: {cell: fuel}, in order of discovery
+        layers[wait][e] = fuel
+        parent = {(e, wait): None}
+        last = {e: (wait, fuel)}    # cell: (turn, fuel) of its last state
+        found = None
+        for t in range(wait, horizon):
+            for c, f in layers[t].items():
+                self.expanded += 1
+                for n in neighbors[c]:
+                    if n == s:
+                        left = f - burned(s, t, t + 1)
+                        if left >= 0 and left >= needed(t + 1):
+                            found = (s, t + 1)
+                            parent[found] = (c, t)
+                            break
+                        continue
+                    if not passable[n]:
+                        continue
+                    k = t + int(cooldown[n])    # the unit acts again when its cooldown is below 1
+                    if k + manhattan(n) > horizon:
+                        continue
+                    left = f - burned(n, t, k)
+                    if left < 0:
+                        continue
+                    seen = last.get(n)
+                    if seen is not None and seen[0] <= k and seen[1] >= left and nights[k] == nights[seen[0]]:
+                        continue
+                    if left > layers[k].get(n, -1):
+                        layers[k][n] = left
+                        parent[n, k] = (c, t)
+                        last[n] = (k, left)
+                if found:
+                    break
+                # waiting in a shelter, the waits out of it only burn fuel
+                if shelter[c] and f > layers[t + 1].get(c, -1):
+                    layers[t + 1][c] = f
+                    parent[c, t + 1] = (c, t)
+            if found:
+                break
+        if found is None:
+            # no path founded
+            return Movement(DIRECTIONS.CENTER, [])
+
+        # follow the parents from the target back to (ex, ey)
+        arrival = found[1]
+        steps = []
+        state = found
+        while parent[state] is not None:
+            c, k = state
+            p = parent[state][0]
+            direction = DIRECTIONS.CENTER if c == p else self.direction[c - p]
+            steps.append((direction, c % width, c // width, arrival - k))
+            state = parent[state]
+        steps.append((DIRECTIONS.CENTER, ex, ey, arrival - state[1]))
+        steps.reverse()
+        return Movement(steps[1][0], steps, arrival)
+
+    def astar(self, sx, sy, ex, ey, passable: List[bool]) -> Movement:
+        """
+        Path from (ex, ey) to (sx, sy) with A*: same length of the path found
+        by 'path' (the search is not cached).
+        The search starts from (sx, sy) and ends at the first expanded cell
+        among (ex, ey) and its neighbors, the heuristic is the Manhattan
+        distance to them. Ties are broken by the heuristic, then by the
+        order of insertion in the queue.
+        """
+        width = self.width
+        s = sy * width + sx
+        e = ey * width + ex
+        if s == e:
+            return Movement(DIRECTIONS.CENTER, [(DIRECTIONS.CENTER, ex, ey, 0)])
+        self.generation += 1
+        generation = self.generation
+        cost = self.cost
+        parent = self.parent
+        stamp = self.stamp
+        closed = self.closed
+        neighbors = self.neighbors
+        around = self.around[e]
+
+        def heuristic(n):
+            return max(abs(n % width - ex) + abs(n // width - ey) - 1, 0)
+
+        stamp[s] = generation
+        cost[s] = 0
+        h = heuristic(s)
+        queue = [(h, h, 0, s)]
+        order = 1
+        found = None
+        while queue:
+            _, _, _, c = heappop(queue)
+            if closed[c] == generation:
+                continue
+            closed[c] = generation
+            self.expanded += 1
+            if c in around:
+                found = c
+                break
+            g = cost[c] + 1
+            for n in neighbors[c]:
+                if passable[n] and (stamp[n] != generation or g < cost[n]):
+                    stamp[n] = generation
+                    cost[n] = g
+                    parent[n] = c
+                    h = heuristic(n)
+                    heappush(queue, (g + h, h, order, n))
+                    order += 1
+        if found is None:
+            # no path founded
+            return Movement(DIRECTIONS.CENTER, [])
+
+        # follow the parents from the reached cell to the target
+        k = cost[found]
+        path = [(DIRECTIONS.CENTER, ex, ey, k + 1)]
+        c, n = e, found
+        while True:
+            path.append((self.direction[n - c], n % width, n // width, k))
+            if not k:
+                break
+            c, n = n, parent[n]
+            k -= 1
+        if len(path) > 1:
+            direction = path[1][0]
+        else:
+            direction = path[0][0]
+        return Movement(direction, path)
+
+
+class DistanceTable:
+    """
+    Length of the shortest path between every pair of cells of a map,
+    (width * height) ^ 2 int16 array indexed by the cells y * width + x
+    (2 MB on 32x32), NO_PATH if there is no path.
+    Units are ignored, the obstacles are the cells no unit can enter (see
+    GameMap._obstacles): they can be the end of a path, not a step of it.
+    The table never changes, new obstacles give a new table (see updated)
+    whose rows are computed on first use.
+    """
+
+    def __init__(self, finder: 'PathFinder', obstacles: List[bool], build=True):
+        self.finder = finder
+        self.obstacles = obstacles
+        size = finder.width * finder.height
+        self._dist = np.full((size, size), NO_PATH, dtype=np.int16)
+        self._stale = [True] * size     # rows still to compute
+        if build:
+            for i in range(size):
+                self._compute(i)
+
+    def updated(self, obstacles: List[bool]) -> 'DistanceTable':
+        """ Table of the map with obstacles, this one if they are the same """
+        if obstacles == self.obstacles:
+            return self
+        return DistanceTable(self.finder, obstacles, build=False)
+
+    def _cell(self, x, y) -> int:
+        """ Index of cell (x, y), IndexError if it is off the map """
+        if not (0 <= x < self.finder.width and 0 <= y < self.finder.height):
+            raise IndexError(f"cell ({x}, {y}) off the {self.finder.width}x{self.finder.height} map")
+        return y * self.finder.width + x
+
+    def row(self, x, y) -> np.ndarray:
+        """ Distances from (x, y) to every cell, indexed by y * width + x """
+        i = self._cell(x, y)
+        if self._stale[i]:
+            self._compute(i)
+        return self._dist[i]
+
+    def distance(self, sx, sy, ex, ey) -> int:
+        """ Length of the shortest path from (sx, sy) to (ex, ey), NO_PATH if none """
+        return int(self.row(sx, sy)[self._cell(ex, ey)])
+
+    def _compute(self, s):
+        """ Breadth first search from cell s, the source is left even if it is an obstacle """
+        neighbors = self.finder.neighbors
+        obstacles = self.obstacles
+        dist = [NO_PATH] * len(obstacles)
+        dist[s] = 0
+        queue = [s]
+        for c in queue:
+            if obstacles[c] and c != s:
+                continue
+            d = dist[c] + 1
+            for n in neighbors[c]:
+                if dist[n] == NO_PATH:
+                    dist[n] = d
+                    queue.append(n)
+        self._dist[s] = dist
+        self._stale[s] = False
+
+
+_finders: Dict[Tuple[int, int], PathFinder] = {}
+
+
+def get_path_finder(width, height) -> PathFinder:
+    """ The shared PathFinder of a map size """
+    finder = _finders.get((width, height))
+    if finder is None:
+        finder = _finders[width, height] = PathFinder(width, height)
+    return finder
@@ -0,0 +1,504 @@
+import heapq
+from typing import Callable, Container, Dict, Iterable, List, Set, Tuple
+
+from .constants import Constants
+from .game_map import GameMap, Position
+
+RESOURCE_TYPES = Constants.RESOURCE_TYPES
+FUEL_RATE = {
+    RESOURCE_TYPES.WOOD: Constants.RESOURCE_TO_FUEL_RATE.WOOD,
+    RESOURCE_TYPES.COAL: Constants.RESOURCE_TO_FUEL_RATE.COAL,
+    RESOURCE_TYPES.URANIUM: Constants.RESOURCE_TO_FUEL_RATE.URANIUM,
+}
+NEIGHBORS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+BUCKET_SIZE = 4     # side of the square of cells of a bucket
+
+
+def manhattan(pos: Position) -> Callable[[int, int], int]:
+    """ Manhattan distance from pos to (x, y) """
+    return lambda x, y: abs(x - pos.x) + abs(y - pos.y)
+
+
+def _bucket(x, y) -> Tuple[int, int]:
+    return x // BUCKET_SIZE, y // BUCKET_SIZE
+
+
+class GridIndex:
+    """
+    Points (x, y) of a map bucketed by BUCKET_SIZE x BUCKET_SIZE squares,
+    for nearest neighbor queries. Each point has a rank (by default its
+    order of insertion) that breaks the ties between equally distant
+    points, lower first.
+    """
+
+    def __init__(self, points: Iterable[Tuple[int, int]] = ()):
+        # (bx, by): {(x, y): rank}
+        self._buckets: Dict[Tuple[int, int], Dict[Tuple[int, int], int]] = {}
+        self._size = 0
+        self._next_rank = 0     # rank of the next point added without one
+        for x, y in points:
+            self.add(x, y)
+
+    def __len__(self):
+        return self._size
+
+    def copy(self) -> 'GridIndex':
+        index = GridIndex()
+        index._buckets = {b: dict(points) for b, points in self._buckets.items()}
+        index._size = self._size
+        index._next_rank = self._next_rank
+        return index
+
+    def add(self, x, y, rank=None):
+        points = self._buckets.setdefault(_bucket(x, y), {})
+        if (x, y) not in points:
+            self._size += 1
+        if rank is None:
+            rank = self._next_rank
+            self._next_rank += 1
+        points[x, y] = rank
+
+    def discard(self, x, y):
+        bucket = _bucket(x, y)
+        points = self._buckets.get(bucket)
+        if points and points.pop((x, y), None) is not None:
+            self._size -= 1
+            if not points:
+                del self._buckets[bucket]
+
+    def k_nearest(self, pos: Position, k, min_distance=0, exclude: Container[Position] = (),
+                  distance: Callable[[int, int], int] = None) -> List[Tuple[int, Tuple[int, int]]]:
+        """
+        The k points closest to pos, as (distance, (x, y)) sorted by
+        distance, then by rank.
+        - min_distance : points closer than this are skipped
+        - exclude      : positions to skip (ex: the ones taken by a job)
+        - distance     : distance from pos to (x, y), Manhattan by default,
+                         never shorter than the Manhattan distance (ex: the
+                         walking distance), None to skip the point
+        """
+        return k_nearest([self], pos, k, min_distance, exclude, distance)
+
+    def nearest(self, pos: Position, min_distance=0, exclude: Container[Position] = (),
+                distance: Callable[[int, int], int] = None) -> Tuple[int, int]:
+        """ The point (x, y) closest to pos, None if none (see k_nearest) """
+        found = self.k_nearest(pos, 1, min_distance, exclude, distance)
+        return found[0][1] if found else None
+
+    def within(self, pos: Position, radius,
+               distance: Callable[[int, int], int] = None) -> List[Tuple[int, Tuple[int, int]]]:
+        """
+        The points at most radius away from pos, as (distance, (x, y))
+        sorted by distance, then by rank (see k_nearest for distance)
+        """
+        return within([self], pos, radius, distance)
+
+
+def _bucket_bound(bx, by, px, py) -> int:
+    """ Manhattan distance from (px, py) to the closest cell of bucket (bx, by) """
+    x0, y0 = bx * BUCKET_SIZE, by * BUCKET_SIZE
+    if px < x0:
+        bound = x0 - px
+    elif px >= x0 + BUCKET_SIZE:
+        bound = px - x0 - BUCKET_SIZE + 1
+    else:
+        bound = 0
+    if py < y0:
+        bound += y0 - py
+    elif py >= y0 + BUCKET_SIZE:
+        bound += py - y0 - BUCKET_SIZE + 1
+    return bound
+
+
+def k_nearest(indexes: List[GridIndex], pos: Position, k, min_distance, exclude, distance):
+    """
+    GridIndex.k_nearest on many indexes: the buckets are visited in order
+    of the Manhattan distance of their closest cell, the ones farther than
+    the k-th point found are not visited
+    """
+    if distance is None:
+        distance = manhattan(pos)
+    px, py = pos.x, pos.y
+    buckets = []    # heap of (bound, order, points)
+    for index in indexes:
+        for (bx, by), points in index._buckets.items():
+            buckets.append((_bucket_bound(bx, by, px, py), len(buckets), points))
+    heapq.heapify(buckets)
+    found = []  # heap of the best k as (-distance, -rank, x, y)
+    while buckets:
+        bound, _, points = heapq.heappop(buckets)
+        if len(found) == k and bound > -found[0][0]:
+            break
+        for (x, y), rank in points.items():
+            if exclude and Position.at(x, y) in exclude:
+                continue
+            d = distance(x, y)
+            if d is None or d < min_distance:
+                continue
+            if len(found) < k:
+                heapq.heappush(found, (-d, -rank, x, y))
+            elif d <= -found[0][0]:
+                item = (-d, -rank, x, y)
+                if item > found[0]:
+                    heapq.heapreplace(found, item)
+    return [(-d, (x, y)) for d, _, x, y in sorted(found, reverse=True)]
+
+
+def within(indexes: List[GridIndex], pos: Position, radius, distance):
+    """
+    GridIndex.within on many indexes: only the buckets with a cell at most
+    radius away (Manhattan distance) are visited
+    """
+    if distance is None:
+        distance = manhattan(pos)
+    px, py = pos.x, pos.y
+    found = []  # (distance, rank, x, y)
+    for index in indexes:
+        for (bx, by), points in index._buckets.items():
+            if _bucket_bound(bx, by, px, py) > radius:
+                continue
+            for (x, y), rank in points.items():
+                d = distance(x, y)
+                if d is not None and d <= radius:
+                    found.append((d, rank, x, y))
+    found.sort()
+    return [(d, (x, y)) for d, _, x, y in found]
+
+
+class ResourceIndex:
+    """
+    Cells with a resource (amount > 0), a GridIndex for each resource type
+    ranked by row order, kept up to date with the cells changed by each
+    update of the map (see GameMap.dirty)
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._indexes: Dict[str, GridIndex] = \
+            {r_type: GridIndex() for r_type in (RESOURCE_TYPES.WOOD, RESOURCE_TYPES.COAL, RESOURCE_TYPES.URANIUM)}
+        self._types: Dict[Tuple[int, int], str] = {}   # (x, y): resource type
+        self.updates = 0    # cells moved, added or removed by the updates
+
+    def __len__(self):
+        return len(self._types)
+
+    def copy(self) -> 'ResourceIndex':
+        index = ResourceIndex.__new__(ResourceIndex)
+        index.width = self.width
+        index.height = self.height
+        index._indexes = {r_type: grid.copy() for r_type, grid in self._indexes.items()}
+        index._types = dict(self._types)
+        index.updates = self.updates
+        return index
+
+    def update(self, game_map: GameMap):
+        """ Applies the changes of the last update of game_map (all of them on the first one) """
+        for x, y in game_map.dirty:
+            resource = game_map.get_cell(x, y).resource
+            r_type = resource.type if resource is not None and resource.amount > 0 else None
+            old = self._types.get((x, y))
+            if old == r_type:
+                continue
+            self.updates += 1
+            if old is not None:
+                self._indexes[old].discard(x, y)
+                del self._types[x, y]
+            if r_type is not None:
+                self._indexes[r_type].add(x, y, y * self.width + x)
+                self._types[x, y] = r_type
+
+    def cells(self, types) -> List[Tuple[int, int]]:
+        """ Cells (x, y) with a resource of types """
+        return [xy for r_type in types for points in self._indexes[r_type]._buckets.values() for xy in points]
+
+    def k_nearest(self, pos: Position, k, types, min_distance=0, exclude: Container[Position] = (),
+                  distance: Callable[[int, int], int] = None) -> List[Tuple[int, Tuple[int, int]]]:
+        """ The k cells with a resource of types closest to pos, see GridIndex.k_nearest """
+        return k_nearest([self._indexes[r_type] for r_type in types],
+                         pos, k, min_distance, exclude, distance)
+
+    def nearest(self, pos: Position, types, min_distance=0, exclude: Container[Position] = (),
+                distance: Callable[[int, int], int] = None) -> Tuple[int, int]:
+        """ The cell (x, y) closest to pos, None if none (see GridIndex.k_nearest) """
+        found = self.k_nearest(pos, 1, types, min_distance, exclude, distance)
+        return found[0][1] if found else None
+
+
+class CityTileIndex:
+    """
+    Citytiles of a player, a GridIndex of all of them and one for each
+    city, ranked by the order of the ct lines of the update. Patched as the
+    ct lines are parsed (see Game._parse_city_tiles): the tiles not in the
+    update are removed at its end.
+    """
+
+    def __init__(self):
+        self._all = GridIndex()
+        self._cities: Dict[str, GridIndex] = {}     # cityid: GridIndex
+        self._tiles: Dict[Tuple[int, int], 'CityTile'] = {}    # (x, y): CityTile
+        self._old_tiles = None  # citytiles of the previous update, during an update
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def copy(self) -> 'CityTileIndex':
+        index = CityTileIndex.__new__(CityTileIndex)
+        index._all = self._all.copy()
+        index._cities = {cityid: grid.copy() for cityid, grid in self._cities.items()}
+        index._tiles = dict(self._tiles)
+        index._old_tiles = None
+        return index
+
+    def _begin_update(self):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        self._old_tiles = self._tiles
+        self._tiles = {}
+
+    def _add(self, citytile, rank):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        x, y = citytile.pos.x, citytile.pos.y
+        old = self._old_tiles.pop((x, y), None)
+        if old is not None and old.cityid != citytile.cityid:
+            self._discard(old)
+        self._all.add(x, y, rank)
+        city = self._cities.get(citytile.cityid)
+        if city is None:
+            city = self._cities[citytile.cityid] = GridIndex()
+        city.add(x, y, rank)
+        self._tiles[x, y] = citytile
+
+    def _end_update(self):
+        """
+        do not use this function, this is for internal tracking of state
+        """
+        for citytile in self._old_tiles.values():
+            self._all.discard(citytile.pos.x, citytile.pos.y)
+            self._discard(citytile)
+        self._old_tiles = None
+
+    def _discard(self, citytile):
+        city = self._cities[citytile.cityid]
+        city.discard(citytile.pos.x, citytile.pos.y)
+        if not city:
+            del self._cities[citytile.cityid]
+
+    def _indexes(self, cityid) -> List[GridIndex]:
+        if cityid is None:
+            return [self._all]
+        city = self._cities.get(cityid)
+        return [city] if city else []
+
+    def get(self, pos: Position) -> 'CityTile':
+        """ The citytile at pos, None if none """
+        return self._tiles.get((pos.x, pos.y))
+
+    def k_nearest(self, pos: Position, k, cityid=None, exclude: Container[Position] = (),
+                  distance: Callable[[int, int], int] = None) -> List[Tuple[int, 'CityTile']]:
+        """
+        The k citytiles closest to pos (only the ones of city cityid if
+        given), as (distance, CityTile), see GridIndex.k_nearest
+        """
+        found = k_nearest(self._indexes(cityid), pos, k, 0, exclude, distance)
+        return [(d, self._tiles[xy]) for d, xy in found]
+
+    def nearest(self, pos: Position, cityid=None, exclude: Container[Position] = (),
+                distance: Callable[[int, int], int] = None) -> 'CityTile':
+        """ The citytile closest to pos, None if none (see k_nearest) """
+        found = self.k_nearest(pos, 1, cityid, exclude, distance)
+        return found[0][1] if found else None
+
+    def within(self, pos: Position, radius, cityid=None,
+               distance: Callable[[int, int], int] = None) -> List[Tuple[int, 'CityTile']]:
+        """
+        The citytiles at most radius away from pos (only the ones of city
+        cityid if given), as (distance, CityTile), see GridIndex.within
+        """
+        return [(d, self._tiles[xy]) for d, xy in within(self._indexes(cityid), pos, radius, distance)]
+
+
+class ResourceCluster:
+    """
+    Connected region of resource cells (4-neighbors, any resource type)
+    - id        : number of the cluster, kept while the cluster does not split
+    - cells     : resource cells (x, y) of the cluster
+    - fuel      : fuel of all the resources of the cluster
+    - type_fuel : fuel of each resource type
+    - bbox      : (min x, min y, max x, max y) of the cells
+    - perimeter : cells (x, y) without resource next to the cluster
+    cells and perimeter are replaced, never changed, by the updates.
+    """
+    __slots__ = ("id", "cells", "fuel", "type_fuel", "bbox", "perimeter")
+
+    def __init__(self, cid, cells: Set[Tuple[int, int]], resources: Dict, width, height):
+        self.id = cid
+        self.cells = cells
+        self.type_fuel = dict.fromkeys(FUEL_RATE, 0)
+        perimeter = set()
+        for x, y in cells:
+            r_type, amount = resources[x, y]
+            self.type_fuel[r_type] += amount * FUEL_RATE[r_type]
+            for dx, dy in NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height and (nx, ny) not in cells:
+                    perimeter.add((nx, ny))
+        self.fuel = sum(self.type_fuel.values())
+        xs = [x for x, _ in cells]
+        ys = [y for _, y in cells]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+        self.perimeter = perimeter
+
+    def __str__(self):
+        return f"cluster {self.id}: {len(self.cells)} cells fuel {self.fuel}"
+
+    def _copy(self) -> 'ResourceCluster':
+        cluster = ResourceCluster.__new__(ResourceCluster)
+        for name in ResourceCluster.__slots__:
+            setattr(cluster, name, getattr(self, name))
+        cluster.type_fuel = dict(self.type_fuel)
+        return cluster
+
+
+class ResourceClusters:
+    """
+    Resource cells of a map labeled by connected region (see
+    ResourceCluster), kept up to date with the cells changed by each update
+    of the map (see GameMap.dirty): a change of amount only changes the
+    fuel of its cluster, the clusters with a cell added or removed are
+    labeled again.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.clusters: Dict[int, ResourceCluster] = {}  # id: ResourceCluster
+        self.labels: Dict[Tuple[int, int], int] = {}    # (x, y): id of the cluster of the cell
+        self._resources: Dict[Tuple[int, int], Tuple[str, int]] = {}   # (x, y): (type, amount)
+        self._border: Dict[Tuple[int, int], Set[int]] = {}  # (x, y): ids of the clusters with the cell in the perimeter
+        self._next_id = 0
+        self.updates = 0    # clusters labeled again by the updates
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def __iter__(self):
+        return iter(self.clusters.values())
+
+    def copy(self) -> 'ResourceClusters':
+        clusters = ResourceClusters.__new__(ResourceClusters)
+        clusters.width = self.width
+        clusters.height = self.height
+        clusters.clusters = {cid: cluster._copy() for cid, cluster in self.clusters.items()}
+        clusters.labels = dict(self.labels)
+        clusters._resources = dict(self._resources)
+        clusters._border = {xy: set(ids) for xy, ids in self._border.items()}
+        clusters._next_id = self._next_id
+        clusters.updates = self.updates
+        return clusters
+
+    def update(self, game_map: GameMap):
+        """ Applies the changes of the last update of game_map (all of them on the first one) """
+        resources = self._resources
+        affected = set()    # ids of the clusters to label again
+        added = []          # new resource cells
+        for x, y in game_map.dirty:
+            resource = game_map.get_cell(x, y).resource
+            new = (resource.type, resource.amount) if resource is not None and resource.amount > 0 else None
+            old = resources.get((x, y))
+            if new == old:
+                continue
+            if new is None:
+                del resources[x, y]
+            else:
+                resources[x, y] = new
+            if old is not None and new is not None and old[0] == new[0]:
+                cluster = self.clusters[self.labels[x, y]]
+                delta = (new[1] - old[1]) * FUEL_RATE[new[0]]
+                cluster.type_fuel[new[0]] += delta
+                cluster.fuel += delta
+            elif old is not None:
+                affected.add(self.labels[x, y])
+            else:
+                added.append((x, y))
+                affected.update(self._border.get((x, y), ()))
+        if affected or added:
+            self._relabel(affected, added)
+
+    def _relabel(self, affected: Set[int], added: List[Tuple[int, int]]):
+        """ Labels again the resource cells of the clusters affected and the ones added """
+        resources = self._resources
+        old_labels = {}     # (x, y): id of the old cluster
+        cells = set(added)
+        for cid in sorted(affected):
+            cluster = self.clusters.pop(cid)
+            for xy in cluster.perimeter:
+                ids = self._border[xy]
+                ids.discard(cid)
+                if not ids:
+                    del self._border[xy]
+            for xy in cluster.cells:
+                del self.labels[xy]
+                if xy in resources:
+                    old_labels[xy] = cid
+                    cells.add(xy)
+        # connected components of the cells, the first one of each old
+        # cluster keeps its id
+        free_ids = set(affected)
+        for seed in sorted(cells):
+            if seed in self.labels:
+                continue
+            component = {seed}
+            stack = [seed]
+            while stack:
+                x, y = stack.pop()
+                for dx, dy in NEIGHBORS:
+                    xy = (x + dx, y + dy)
+                    if xy in cells and xy not in component:
+                        component.add(xy)
+                        stack.append(xy)
+            reused = sorted(free_ids.intersection(old_labels[xy] for xy in component if xy in old_labels))
+            if reused:
+                cid = reused[0]
+                free_ids.discard(cid)
+            else:
+                cid = self._next_id
+                self._next_id += 1
+            cluster = self.clusters[cid] = ResourceCluster(cid, component, resources, self.width, self.height)
+            for xy in component:
+                self.labels[xy] = cid
+            for xy in cluster.perimeter:
+                self._border.setdefault(xy, set()).add(cid)
+            self.updates += 1
+
+    def cluster_at(self, x, y) -> ResourceCluster:
+        """ The cluster of the resource cell (x, y), None if no resource """
+        cid = self.labels.get((x, y))
+        return None if cid is None else self.clusters[cid]
+
+    def clusters_around(self, x, y) -> List[ResourceCluster]:
+        """ The clusters with the cell (x, y) in the perimeter """
+        return [self.clusters[cid] for cid in sorted(self._border.get((x, y), ()))]
+
+    def count_workers(self, positions: Iterable[Position]) -> Dict[int, int]:
+        """
+        Workers of each cluster (id: number), from the positions of the
+        units working on resources (one for each unit): a unit counts for
+        the cluster of its cell, or in a perimeter cell for the cluster of
+        lowest id among the ones around it
+        """
+        workers = dict.fromkeys(self.clusters, 0)
+        for pos in positions:
+            xy = (pos.x, pos.y)
+            cid = self.labels.get(xy)
+            if cid is None:
+                ids = self._border.get(xy)
+                if not ids:
+                    continue
+                cid = min(ids)
+            workers[cid] += 1
+        return workers
@@ -1,16 +1,49 @@
-from typing import Dict
+from typing import Dict, List
 import sys
 from agent import agent
-if __name__ == "__main__":
-    
-    def read_input():
+
+
+class TurnReader:
+    """
+    Reads the engine input a whole turn at a time: the bytes available on
+    the stream are pulled in blocks until the D_DONE line arrives
+    """
+    def __init__(self, stream):
+        self.stream = stream    # binary buffered stream (ex: sys.stdin.buffer)
+        self.buffer = b""
+
+    def read_turn(self) -> List[str]:
         """
-        Reads input from stdin
+        Returns the lines of the next turn, D_DONE included
         """
-        try:
-            return input()
-        except EOFError as eof:
-            raise SystemExit(eof)
+        start = 0
+        while True:
+            done = self.buffer.find(b"D_DONE", start)
+            if done >= 0:
+                end = self.buffer.find(b"\n", done)
+                if end >= 0:
+                    block = self.buffer[:end]
+                    self.buffer = self.buffer[end + 1:]
+                    return block.decode().splitlines()
+                start = done
+            else:
+                start = max(0, len(self.buffer) - len(b"D_DONE"))
+            data = self.stream.read1(1 << 16)
+            if not data:
+                raise SystemExit("EOF")
+            self.buffer += data
+
+
+def write_turn(stream, actions: List[str]):
+    """
+    Writes the actions and D_FINISH with a single flushed write
+    """
+    stream.write(",".join(actions) + "\nD_FINISH\n")
+    stream.flush()
+
+
+if __name__ == "__main__":
+
     step = 0
     class Observation(Dict[str, any]):
         def __init__(self, player=0) -> None:
@@ -21,17 +54,14 @@ if __name__ == "__main__":
     observation["updates"] = []
     observation["step"] = 0
     player_id = 0
+    reader = TurnReader(sys.stdin.buffer)
     while True:
-        inputs = read_input()
-        observation["updates"].append(inputs)
-        
+        observation["updates"] = reader.read_turn()
+
         if step == 0:
             player_id = int(observation["updates"][0])
             observation.player = player_id
-        if inputs == "D_DONE":
-            actions = agent(observation, None)
-            observation["updates"] = []
-            step += 1
-            observation["step"] = step
-            print(",".join(actions))
-            print("D_FINISH")
\ No newline at end of file
+        actions = agent(observation, None)
+        step += 1
+        observation["step"] = step
+        write_turn(sys.stdout, actions)
@@ -0,0 +1,80 @@
+# used to test the space-time reservations of abn.actions.Actions.move_to
+# (python tests/test_actions.py)
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+
+from abn.game_ext import GameExtended
+from abn.actions import Actions
+from lux.game_map import Position
+
+WIDTH, HEIGHT = 7, 7
+CROSS = 3   # the open cells are the row and the column CROSS, the other ones enemy citytiles
+
+
+class Observation(dict):
+    pass
+
+
+def game_state(units, roads=()):
+    """ GameExtended of player 0 on the cross: units (id, x, y, cooldown), roads (x, y, level) """
+    lines = ["0", f"{WIDTH} {HEIGHT}", "rp 0 0", "rp 1 0", "c 1 c_9 1000 10"]
+    lines += [f"ct 1 c_9 {x} {y} 0" for y in range(HEIGHT) for x in range(WIDTH) if CROSS not in (x, y)]
+    lines += [f"u 0 0 {uid} {x} {y} {cooldown} 0 0 0" for uid, x, y, cooldown in units]
+    lines += [f"ccd {x} {y} {level}" for x, y, level in roads]
+    observation = Observation(updates=lines + ["D_DONE"], step=0)
+    observation.player = 0
+    game = GameExtended()
+    game._update(observation)
+    return game
+
+
+def unit(game, uid):
+    return game.player.unit_by_id[uid]
+
+
+# two paths crossing at (CROSS, CROSS): the unit planned second never takes
+# the center in a turn the first one is there, the first one stays in each
+# cell for its cooldown, reduced by the road
+game = game_state([("u_1", 0, CROSS, 0), ("u_2", CROSS, 0, 0)], roads=[(CROSS + 1, CROSS, 1)])
+actions = Actions(game)
+center = Position.at(CROSS, CROSS)
+assert actions.move_to(unit(game, "u_1"), Position.at(WIDTH - 1, CROSS), playerid=0)
+assert actions.move_to(unit(game, "u_2"), Position.at(CROSS, HEIGHT - 1), playerid=0)
+first, second = actions._plans["u_1"], actions._plans["u_2"]
+# u_1 (HORIZON moves): (1, 3) in turns 1-2, (2, 3) in turns 3-4, the
+# center in turns 5-6, the road (4, 3) in turn 7 only
+assert actions.next_pos["u_1"] == Position.at(1, CROSS)
+assert first == [(2, Position.at(1, CROSS)), (3, Position.at(2, CROSS)), (4, Position.at(2, CROSS)),
+                 (5, center), (6, center), (7, Position.at(CROSS + 1, CROSS))], first
+assert not set(first) & set(second), (first, second)
+# u_2 alone would be in the center in turns 5-6: it waits 2 turns in
+# (3, 1), then reaches (3, 2) in turn 5, to enter the center once u_1 left
+assert second == [(2, Position.at(CROSS, 1)), (3, Position.at(CROSS, 1)), (4, Position.at(CROSS, 1)),
+                  (5, Position.at(CROSS, 2)), (6, Position.at(CROSS, 2))], second
+alone = Actions(game)
+alone.move_to(unit(game, "u_2"), Position.at(CROSS, HEIGHT - 1), playerid=0)
+assert (5, center) in alone._plans["u_2"] and (6, center) in alone._plans["u_2"], alone._plans["u_2"]
+assert sum(actions._reserved.values()) == len(first) + len(second)
+
+# planned again, a unit gives back its old reservations
+actions.move_to(unit(game, "u_2"), Position.at(CROSS, HEIGHT - 1), playerid=0)
+assert sum(actions._reserved.values()) == len(first) + len(actions._plans["u_2"])
+
+# a unit cooling down keeps its cell until it can act again: int(cooldown)
+# turns, the next one through next_pos
+game = game_state([("u_1", CROSS, CROSS, 3.5), ("u_2", 0, CROSS, 0)])
+actions = Actions(game)
+actions.stay(unit(game, "u_1"))
+assert actions._plans["u_1"] == [(2, center), (3, center)], actions._plans["u_1"]
+assert actions._isReserved(center, 1, 1) and actions._isReserved(center, 3, 3)
+assert not actions._isReserved(center, 4, 6)
+# a unit that can act next turn reserves only next_pos
+actions.stay(unit(game, "u_2"))
+assert "u_2" not in actions._plans and actions._isReserved(Position.at(0, CROSS), 1, 1)
+assert not actions._isReserved(Position.at(0, CROSS), 2, 2)
+
+print("test_actions ok")
@@ -0,0 +1,94 @@
+# used to test the events of Game._update against the units and the cities
+# of two successive turns of generated games
+# (python tests/test_events.py)
+
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from lux.game import Game, Event
+from lux.array_map import ArrayGameMap
+
+rnd = random.Random(0)
+
+
+def state(game):
+    """ (team, unit id): position, (team, city id): number of citytiles """
+    units = {(p.team, u.id): u.pos for p in game.players for u in p.units}
+    cities = {(p.team, cityid): len(city.citytiles) for p in game.players for cityid, city in p.cities.items()}
+    return units, cities
+
+
+def expected_events(before, after):
+    """ (kind, team, id, data) of the changes between two states """
+    (units, cities), (new_units, new_cities) = before, after
+    events = set()
+    for (team, uid), pos in new_units.items():
+        if (team, uid) not in units:
+            events.add((Event.UNIT_SPAWNED, team, uid, None))
+        elif units[team, uid] != pos:
+            events.add((Event.UNIT_MOVED, team, uid, units[team, uid]))
+    events.update((Event.UNIT_DIED, team, uid, None) for team, uid in units if (team, uid) not in new_units)
+    for (team, cityid), n_tiles in new_cities.items():
+        if (team, cityid) not in cities:
+            events.add((Event.CITY_FOUNDED, team, cityid, None))
+        elif n_tiles > cities[team, cityid]:
+            events.add((Event.CITY_GREW, team, cityid, cities[team, cityid]))
+    events.update((Event.CITY_DESTROYED, team, cityid, None) for team, cityid in cities
+                  if (team, cityid) not in new_cities)
+    return events
+
+
+def lose_cities(observations, turn, n):
+    """ The observations with n cities of turn removed from turn on """
+    names = [line.split()[2] for line in observations[turn] if line.startswith("c ")]
+    lost = set(rnd.sample(names, n))
+    return observations[:turn] + [[line for line in updates if not (line.startswith(("c ", "ct "))
+                                                                      and line.split()[2] in lost)]
+                                  for updates in observations[turn:]]
+
+
+# generated games with some cities lost, played with and without snapshots
+# (the cities and the units are then replaced, not updated in place)
+checked = 0
+for seed, snapshots in [(0, False), (1, True), (2, True)]:
+    observations = lose_cities(make_observations(seed=seed), 200, 3)
+    game = Game(incremental=True, map_class=ArrayGameMap)
+    game._initialize(observations[0][:2])
+    before = ({}, {})
+    objects = {}    # (team, unit id): Unit
+    destroyed = 0
+    for turn, updates in enumerate(observations):
+        dead = {(p.team, uid): u for p in game.players for uid, u in p.unit_by_id.items()}
+        if snapshots and rnd.random() < 0.3:
+            game.snapshot()
+        game._update(updates[2:] if turn == 0 else updates)
+        after = state(game)
+        events = {(e.kind, e.team, e.id, e.data) for e in game.events}
+        assert events == expected_events(before, after), (seed, turn)
+        for e in game.events:
+            if e.kind == Event.UNIT_DIED:
+                # the unit of its last turn
+                assert e.obj is dead[e.team, e.id] and e.obj.pos == before[0][e.team, e.id], (seed, turn)
+            elif e.kind in (Event.UNIT_SPAWNED, Event.UNIT_MOVED):
+                assert e.obj is game.players[e.team].unit_by_id[e.id], (seed, turn)
+            elif e.kind != Event.CITY_DESTROYED:
+                assert e.obj is game.players[e.team].cities[e.id], (seed, turn)
+        for player in game.players:
+            assert set(player.unit_by_id) == {u.id for u in player.units}, (seed, turn)
+            if not snapshots:
+                # the same Unit object while the unit lives
+                for unit in player.units:
+                    assert objects.setdefault((player.team, unit.id), unit) is unit, (seed, turn)
+        checked += len(events)
+        destroyed += sum(e.kind == Event.CITY_DESTROYED for e in game.events)
+        before = after
+    assert destroyed >= 3, (seed, destroyed)
+
+assert checked
+print("test_events ok")
@@ -0,0 +1,80 @@
+# used to test GameExtended.find_closest_freespace against a search of the
+# whole map, with the memo kept and dropped between the updates
+# (python tests/test_freespace.py)
+
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from abn.game_ext import GameExtended
+from lux.game_map import Position
+
+rnd = random.Random(0)
+
+
+class Observation(dict):
+    pass
+
+
+def closest_free(game, pos, max_radius):
+    """ Distance to the closest free cell (no resource, no citytile) within max_radius, None if none """
+    distances = [abs(x - pos.x) + abs(y - pos.y)
+                 for y in range(game.map_height) for x in range(game.map_width)
+                 if game.map.get_cell(x, y).resource is None and not game.map.get_cell(x, y).citytile]
+    distances = [d for d in distances if d <= max_radius]
+    return min(distances) if distances else None
+
+
+def check(game, pos, max_radius):
+    found = game.find_closest_freespace(pos, max_radius)
+    distance = closest_free(game, pos, max_radius)
+    if distance is None:
+        assert found == pos, (pos, found)
+    else:
+        cell = game.map.get_cell(found.x, found.y)
+        assert cell.resource is None and not cell.citytile, (pos, found)
+        assert abs(found.x - pos.x) + abs(found.y - pos.y) == distance, (pos, found, distance)
+    return found
+
+
+# the free cell found before is covered by a citytile, then a resource
+# runs out: the memo gives the new closest cell
+WIDTH, HEIGHT = 7, 7
+free = {(5, 3), (0, 0)}
+lines = ["rp 0 0", "rp 1 0"] + [f"r wood {x} {y} 100" for y in range(HEIGHT) for x in range(WIDTH)
+                               if (x, y) not in free]
+game = GameExtended()
+observation = Observation(updates=["0", f"{WIDTH} {HEIGHT}"] + lines + ["D_DONE"], step=0)
+observation.player = 0
+game._update(observation)
+center = Position.at(3, 3)
+assert check(game, center, 10) == Position.at(5, 3)
+assert check(game, center, 1) == center     # none within 1
+city = ["c 0 c_1 0 10", "ct 0 c_1 5 3 0"]
+observation.update(updates=lines + city + ["D_DONE"], step=1)
+game._update(observation)
+assert check(game, center, 10) == Position.at(0, 0)
+observation.update(updates=[line for line in lines if line != "r wood 3 4 100"] + city + ["D_DONE"], step=2)
+game._update(observation)
+assert check(game, center, 10) == Position.at(3, 4)
+assert check(game, Position.at(3, 4), 10) == Position.at(3, 4)
+
+# generated games, the same positions asked on many turns
+for seed in range(2):
+    game = GameExtended()
+    observation = Observation()
+    observation.player = seed % 2
+    positions = [Position.at(rnd.randrange(32), rnd.randrange(32)) for _ in range(10)]
+    for step, updates in enumerate(make_observations(seed=seed, player=seed % 2)):
+        observation["updates"] = updates
+        observation["step"] = step
+        game._update(observation)
+        for pos in rnd.sample(positions, 3):
+            check(game, pos, rnd.choice([1, 3, 10]))
+
+print("test_freespace ok")
@@ -0,0 +1,68 @@
+# used to test the parsing of the update lines by Game
+# (python tests/test_game.py)
+
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from lux.game import Game
+from lux.array_map import ArrayGameMap
+from lux.constants import Constants
+
+INPUT_CONSTANTS = Constants.INPUT_CONSTANTS
+
+
+def state(game):
+    """ Everything parsed from the update lines """
+    cells = []
+    for y in range(game.map_height):
+        for x in range(game.map_width):
+            cell = game.map.get_cell(x, y)
+            resource = cell.resource and (cell.resource.type, cell.resource.amount)
+            cells.append((resource, cell.road, cell.citytile and (cell.citytile.cityid, cell.citytile.cooldown)))
+    players = [(p.research_points, [(u.id, u.type, u.pos, u.cooldown, u.cargo.wood, u.cargo.coal, u.cargo.uranium)
+                                    for u in p.units],
+                sorted((c.cityid, c.fuel, c.light_upkeep) for c in p.cities.values())) for p in game.players]
+    return cells, players
+
+
+def play(observations):
+    game = Game(incremental=True, map_class=ArrayGameMap)
+    game._initialize(observations[0][:2])
+    game._update(observations[0][2:])
+    for updates in observations[1:]:
+        game._update(updates)
+    return game
+
+
+rnd = random.Random(0)
+observations = make_observations(turns=60, seed=3)
+expected = state(play(observations))
+
+# doubled, trailing spaces and extra fields do not shift the fields
+spaced = []
+for turn, updates in enumerate(observations):
+    lines = list(updates[:2]) if turn == 0 else []  # map size and player id
+    for line in updates[len(lines):]:
+        if line != INPUT_CONSTANTS.DONE and rnd.random() < 0.2:
+            line = rnd.choice([line + " ", line.replace(" ", "  ", 1), line + " 0"])
+        lines.append(line)
+    spaced.append(lines)
+assert state(play(spaced)) == expected
+
+# a line with missing fields is an error, not fields of the next line
+short = [list(updates) for updates in observations[:2]]
+short[1].insert(0, "r wood 1")
+try:
+    play(short)
+except ValueError:
+    pass
+else:
+    assert False, "short line parsed"
+
+print("test_game ok")
@@ -0,0 +1,89 @@
+# used to test the paths cached by the jobs across the turns
+# (GameExtended.jobPath, cachedJobPath and setJobPath)
+# (python tests/test_job_paths.py)
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+
+from abn.game_ext import GameExtended
+from abn.jobs import Job
+from lux.game_map import Position
+
+WIDTH, HEIGHT = 7, 7
+ROW = 3     # the open cells, the other ones enemy citytiles
+
+
+class Observation(dict):
+    pass
+
+
+def update(game, step, units, roads=()):
+    """ Turn step of player 0 on ROW and ROW + 1: units (id, x, y), roads (x, y, level) """
+    lines = ["rp 0 0", "rp 1 0", "c 1 c_9 1000 10"]
+    lines += [f"ct 1 c_9 {x} {y} 0" for y in range(HEIGHT) for x in range(WIDTH) if y not in (ROW, ROW + 1)]
+    lines += [f"u 0 0 {uid} {x} {y} 0 0 0 0" for uid, x, y in units]
+    lines += [f"ccd {x} {y} {level}" for x, y, level in roads]
+    if step == 0:
+        lines = ["0", f"{WIDTH} {HEIGHT}"] + lines
+    observation = Observation(updates=lines + ["D_DONE"], step=step)
+    observation.player = 0
+    game._update(observation)
+    return game.player.unit_by_id["u_1"]
+
+
+def cells(path):
+    return [(x, y) for _, x, y, _ in path]
+
+
+game = GameExtended()
+job = Job("explore", Position.at(WIDTH - 1, ROW))
+target = [(WIDTH - 1, ROW)]
+
+# computed once, then reused in the same turn
+unit = update(game, 0, [("u_1", 0, ROW)])
+move = game.jobPath(unit, job, playerid=0)
+path = move.path
+assert cells(path)[0] == (0, ROW) and cells(path)[-1] == (WIDTH - 1, ROW), path
+assert game.jobPath(unit, job, playerid=0).path is path
+assert (game.path_replans, game.path_reuses) == (1, 1)
+
+# the unit did the first step: the rest of the path is kept, even with a
+# changed cell that can still be entered (a road)
+x, y = cells(path)[1]
+unit = update(game, 1, [("u_1", x, y)], roads=[cells(path)[3] + (1,)])
+assert game.cachedJobPath(unit, job, job.path_key) == path[1:]
+assert game.jobPath(unit, job, playerid=0).direction == path[2][0]
+assert (game.path_replans, game.path_reuses) == (1, 2)
+
+# other parameters, or a unit off the path, compute it again
+key = job.path_key
+assert game.cachedJobPath(unit, job, (job.pos, True, 0, False)) is None
+off = update(game, 2, [("u_1", x, y + 1)])
+assert game.cachedJobPath(off, job, key) is None
+
+# a cell of the path blocked by a unit: the path goes around it
+unit = update(game, 3, [("u_1", x, y)])
+assert game.cachedJobPath(unit, job, key) is not None
+blocked = cells(job.path)[2]
+unit = update(game, 4, [("u_1", x, y), ("u_2",) + blocked])
+assert game.cachedJobPath(unit, job, key) is None
+move = game.jobPath(unit, job, playerid=0)
+assert blocked not in cells(move.path) and cells(move.path)[-1] in target, move.path
+
+# a cell blocked while the path was not checked is not dirty in the next
+# update: all the cells are checked
+game.setJobPath(job, key, path[1:])
+unit = update(game, 5, [("u_1", x, y), ("u_2",) + cells(path)[3]])
+unit = update(game, 6, [("u_1", x, y), ("u_2",) + cells(path)[3]])
+assert cells(path)[3] not in game.map.dirty
+assert game.cachedJobPath(unit, job, key) is None
+
+# the target can always be entered
+game.setJobPath(job, key, path[1:])
+unit = update(game, 7, [("u_1", x, y), ("u_2", WIDTH - 1, ROW)])
+assert game.cachedJobPath(unit, job, key) == path[1:]
+
+print("test_job_paths ok")
@@ -0,0 +1,56 @@
+# used to test the layers of abn.game_ext.GameExtended, kept and patched
+# between updates, against maps built again on each turn of generated games
+# (python tests/test_layers.py)
+
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from abn.game_ext import GameExtended
+from lux.game_map import Position
+
+rnd = random.Random(0)
+
+
+class Observation(dict):
+    pass
+
+
+def check_layer(game, name):
+    """ The layer equals the map built from the current game """
+    kept = getattr(game, name)
+    fresh = getattr(GameExtended, name).build(game)
+    if name.endswith("_index"):
+        kept, fresh = kept._buckets, fresh._buckets
+    elif name == "free_cells":
+        kept, fresh = dict(enumerate(kept)), dict(enumerate(fresh))
+    elif name == "freespace_memo":
+        game.find_closest_freespace(Position.at(rnd.randrange(game.map_width), rnd.randrange(game.map_height)))
+        fresh = {key: game._search_freespace(Position.at(key[0], key[1]), key[2]) for key in kept}
+    # same keys in the same order: the indexes break ties by order
+    assert list(kept.items()) == list(fresh.items()), name
+
+
+# every layer read on each turn, then only some of them: a layer not read
+# for several updates is patched with the dirty cells of all of them
+for seed, read in [(0, 1.0), (1, 0.3)]:
+    game = GameExtended()
+    observation = Observation()
+    observation.player = seed % 2
+    for step, updates in enumerate(make_observations(seed=seed, player=seed % 2)):
+        observation["updates"] = updates
+        observation["step"] = step
+        game._update(observation)
+        for name in game.LAYERS:
+            if rnd.random() < read:
+                check_layer(game, name)
+    assert game.layer_patches["energy_map"] and game.layer_patches["free_cells"], game.layer_patches
+    # patched between updates, built again when the research changes
+    assert game.layer_misses["explore_map"] < 10, game.layer_misses
+
+print("test_layers ok")
@@ -0,0 +1,290 @@
+# used to test the path searches of lux.pathfinding against plain reference
+# searches on random maps and generated games (python tests/test_pathfinding.py)
+
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from lux.constants import Constants
+from lux.game import Game
+from lux.game_map import Position, GameMap
+from lux.array_map import ArrayGameMap
+from lux.pathfinding import DistanceTable, get_path_finder, NO_PATH
+from abn.game_ext import GameExtended, is_night, NIGHT_START, CYCLE_LENGTH
+
+DIRECTIONS = Constants.DIRECTIONS
+WIDTH, HEIGHT = 12, 12
+NEIGHBORS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+
+###############################################################################
+# REFERENCE SEARCHES
+###############################################################################
+def bfs(sx, sy, blocked):
+    """ Steps from (sx, sy) to every cell, blocked cells can be entered but not left """
+    dist = {(sx, sy): 0}
+    queue = [(sx, sy)]
+    for x, y in queue:
+        if (x, y) != (sx, sy) and blocked[y * WIDTH + x]:
+            continue
+        for dx, dy in NEIGHBORS:
+            n = (x + dx, y + dy)
+            if 0 <= n[0] < WIDTH and 0 <= n[1] < HEIGHT and n not in dist:
+                dist[n] = dist[x, y] + 1
+                queue.append(n)
+    return dist
+
+
+def path_to(epos, spos, game_map, noCities=False, noResources=False, playerid=None):
+    """ Position.path_to before lux.pathfinding: (direction, path) """
+    check_dirs = [DIRECTIONS.NORTH, DIRECTIONS.EAST, DIRECTIONS.SOUTH, DIRECTIONS.WEST]
+    open_list = [(spos.x, spos.y)]
+    board = {(x, y): None for x in range(game_map.width) for y in range(game_map.height)}
+    board[spos.x, spos.y] = 0
+    while open_list:
+        cur_pos = open_list.pop(0)
+        cur_cell = game_map.get_cell(cur_pos[0], cur_pos[1])
+        dist = board[cur_pos]
+        if cur_cell.pos.is_adjacent(epos):
+            board[epos.x, epos.y] = dist + 1
+            break
+        for direction in check_dirs:
+            next_pos = cur_cell.pos.translate(direction, 1)
+            if not (0 <= next_pos.x < game_map.width and 0 <= next_pos.y < game_map.height):
+                continue
+            next_cell = game_map.get_cell_by_pos(next_pos)
+            ct = next_cell.citytile
+            if ct and (noCities or not ct.team == playerid):
+                continue
+            if noResources and next_cell.resource:
+                continue
+            if next_cell.units or board[next_pos.x, next_pos.y] is not None:
+                continue
+            board[next_pos.x, next_pos.y] = dist + 1
+            open_list.append((next_pos.x, next_pos.y))
+    dist = board[epos.x, epos.y]
+    if not dist:
+        return DIRECTIONS.CENTER, []
+    cur_step = (DIRECTIONS.CENTER, epos.x, epos.y, dist)
+    path = [cur_step]
+    dist -= 1
+    while dist >= 0:
+        for direction in check_dirs:
+            next_pos = Position(cur_step[1], cur_step[2]).translate(direction, 1)
+            if 0 <= next_pos.x < game_map.width and 0 <= next_pos.y < game_map.height and \
+                    board[next_pos.x, next_pos.y] == dist:
+                cur_step = (direction, next_pos.x, next_pos.y, dist)
+                path.append(cur_step)
+                dist -= 1
+                break
+    return path[1][0] if len(path) > 1 else path[0][0], path
+
+
+def dijkstra(sx, sy, ex, ey, passable, cooldown):
+    """ Turns from (ex, ey) to (sx, sy) of PathFinder.dijkstra, None if no path """
+    s, e = sy * WIDTH + sx, ey * WIDTH + ex
+    turns = {e: 0}
+    done = set()
+    while True:
+        todo = [c for c in turns if c not in done]
+        if not todo:
+            return None
+        c = min(todo, key=turns.get)
+        if c == s:
+            return turns[c]
+        done.add(c)
+        x, y = c % WIDTH, c // WIDTH
+        for dx, dy in NEIGHBORS:
+            if 0 <= x + dx < WIDTH and 0 <= y + dy < HEIGHT:
+                n = (y + dy) * WIDTH + x + dx
+                if n == s:
+                    k = turns[c] + 1
+                elif passable[n]:
+                    k = turns[c] + int(cooldown[n])
+                else:
+                    continue
+                if n not in turns or k < turns[n]:
+                    turns[n] = k
+
+
+def night_safe(sx, sy, ex, ey, passable, cooldown, shelter, night, fuel, upkeep, horizon, wait, income):
+    """ Fewest turns of PathFinder.night_safe by a search of every (cell, turn, fuel) state """
+    def burned(c, k0, k1):
+        return 0 if shelter[c] else upkeep * sum(night[k0 + 1:k1 + 1])
+
+    def needed(k):
+        n = 0
+        while k + 1 + n < len(night) and night[k + 1 + n]:
+            n += 1
+        return (0 if shelter[s] else max(0, upkeep - income)) * n
+
+    s, e = sy * WIDTH + sx, ey * WIDTH + ex
+    if s == e:
+        return 0
+    start = (e, wait, fuel - burned(e, 0, wait))
+    if start[2] < 0:
+        return None
+    best = None
+    seen = {start}
+    stack = [start]
+    while stack:
+        c, t, f = stack.pop()
+        if t >= horizon:
+            continue
+        x, y = c % WIDTH, c // WIDTH
+        nexts = [(c, t + 1, f)] if shelter[c] else []
+        for dx, dy in NEIGHBORS:
+            if not (0 <= x + dx < WIDTH and 0 <= y + dy < HEIGHT):
+                continue
+            n = (y + dy) * WIDTH + x + dx
+            if n == s:
+                left = f - burned(s, t, t + 1)
+                if left >= 0 and left >= needed(t + 1) and (best is None or t + 1 < best):
+                    best = t + 1
+            elif passable[n]:
+                k = t + int(cooldown[n])
+                nexts.append((n, k, f - burned(n, t, k)))
+        for state in nexts:
+            if state[1] <= horizon and state[2] >= 0 and state not in seen:
+                seen.add(state)
+                stack.append(state)
+    return best
+
+
+def random_cells(rnd, density):
+    return [rnd.random() < density for _ in range(WIDTH * HEIGHT)]
+###############################################################################
+
+rnd = random.Random(0)
+finder = get_path_finder(WIDTH, HEIGHT)
+
+# DistanceTable: every pair against the reference, lazy rows after updated
+for _ in range(5):
+    obstacles = random_cells(rnd, 0.25)
+    table = DistanceTable(finder, obstacles)
+    lazy = DistanceTable(finder, random_cells(rnd, 0.25)).updated(obstacles)
+    for sy in range(HEIGHT):
+        for sx in range(WIDTH):
+            dist = bfs(sx, sy, obstacles)
+            for ey in range(HEIGHT):
+                for ex in range(WIDTH):
+                    d = dist.get((ex, ey), NO_PATH)
+                    assert table.distance(sx, sy, ex, ey) == d, (sx, sy, ex, ey)
+                    assert lazy.distance(sx, sy, ex, ey) == d, (sx, sy, ex, ey)
+
+# DistanceTable: off-map cells are errors, not other cells
+for args in [(-1, -1, 0, 0), (0, 0, -1, 0), (WIDTH, 0, 0, 0), (0, 0, 0, HEIGHT)]:
+    try:
+        table.distance(*args)
+    except IndexError:
+        pass
+    else:
+        assert False, args
+
+# Position.path_to: the paths of the search before lux.pathfinding, on
+# generated games with units, citytiles and resources
+for seed, map_class in [(0, GameMap), (1, ArrayGameMap)]:
+    observations = make_observations(turns=120, seed=seed)
+    state = Game(incremental=True, map_class=map_class)
+    state._initialize(observations[0][:2])
+    state._update(observations[0][2:])
+    for turn, updates in enumerate(observations[1:], 1):
+        state._update(updates)
+        if turn % 20:
+            continue
+        units = [unit for player in state.players for unit in player.units]
+        for _ in range(40):
+            unit = rnd.choice(units)
+            target = Position.at(rnd.randrange(state.map_width), rnd.randrange(state.map_height))
+            if target == unit.pos:
+                continue
+            options = dict(noCities=rnd.random() < 0.5, noResources=rnd.random() < 0.3, playerid=rnd.choice([0, 1]))
+            move = unit.pos.path_to(target, state.map, **options)
+            assert (move.direction, move.path) == path_to(unit.pos, target, state.map, **options), \
+                (seed, turn, unit.pos, target, options)
+
+# astar: same length as the breadth first search, on a path of the same cells
+for case in range(300):
+    passable = [not blocked for blocked in random_cells(rnd, 0.3)]
+    sx, sy, ex, ey = (rnd.randrange(WIDTH) for _ in range(4))
+    if (sx, sy) == (ex, ey):
+        continue
+    dist = bfs(sx, sy, [not free for free in passable])
+    # the start cell (a unit) is never entered, its neighbors end the search
+    lengths = [dist[n] + 1 for n in ((ex + dx, ey + dy) for dx, dy in NEIGHBORS)
+               if n in dist and (n == (sx, sy) or passable[n[1] * WIDTH + n[0]])]
+    move = finder.astar(sx, sy, ex, ey, passable)
+    if not lengths:
+        assert not move.path, case
+        continue
+    assert move.path and move.path[0][3] == min(lengths), (case, move.path, min(lengths))
+    assert (move.path[0][1], move.path[0][2]) == (ex, ey) and (move.path[-1][1], move.path[-1][2]) == (sx, sy)
+    for a, b in zip(move.path, move.path[1:]):
+        assert abs(a[1] - b[1]) + abs(a[2] - b[2]) == 1 and a[3] == b[3] + 1, (case, move.path)
+        assert (b[1], b[2]) == (sx, sy) or passable[b[2] * WIDTH + b[1]], (case, move.path)
+
+# dijkstra: fewest turns with the cooldown of each cell (roads), a unit
+# acts again int(cooldown) turns later, the steps of the path in turns to
+# the target
+for case in range(300):
+    passable = [not blocked for blocked in random_cells(rnd, 0.25)]
+    cooldown = [rnd.choice([1, 1.5, 2, 3]) for _ in range(WIDTH * HEIGHT)]
+    sx, sy, ex, ey = (rnd.randrange(WIDTH) for _ in range(4))
+    if (sx, sy) == (ex, ey):
+        continue
+    move = finder.dijkstra(sx, sy, ex, ey, passable, cooldown)
+    expected = dijkstra(sx, sy, ex, ey, passable, cooldown)
+    if expected is None:
+        assert not move.path, case
+        continue
+    assert move.path and move.arrival == expected == move.path[0][3], (case, move.arrival, expected)
+    assert (move.path[-1][1], move.path[-1][2], move.path[-1][3]) == (sx, sy, 0), (case, move.path)
+    for a, b in zip(move.path, move.path[1:]):
+        assert abs(a[1] - b[1]) + abs(a[2] - b[2]) == 1, (case, move.path)
+        c = b[2] * WIDTH + b[1]
+        assert a[3] - b[3] == (1 if (b[1], b[2]) == (sx, sy) else int(cooldown[c])) and \
+            ((b[1], b[2]) == (sx, sy) or passable[c]), (case, move.path)
+
+# GameExtended.distance: Manhattan distance off the map
+game = GameExtended()
+game.map_width, game.map_height = WIDTH, HEIGHT
+game.distances = table
+assert game.distance(Position(-1, -1), Position(2, 3)) == 7
+assert game.distance(Position(2, 3), Position(-1, -1)) == 7
+assert game.distance(Position(0, 0), Position(0, 0)) == 0
+
+# night_safe: fewest turns against every route, on the nights played by the agent
+for case in range(300):
+    passable = [not blocked for blocked in random_cells(rnd, 0.2)]
+    shelter = [free and city for free, city in zip(passable, random_cells(rnd, 0.1))]
+    cooldown = [rnd.choice([1, 1, 2, 2, 3]) for _ in range(WIDTH * HEIGHT)]
+    horizon = rnd.randint(4, 12)
+    turn = rnd.randrange(CYCLE_LENGTH)
+    night = [is_night(turn + k) for k in range(horizon + CYCLE_LENGTH - NIGHT_START + 1)]
+    sx, sy, ex, ey = (rnd.randrange(WIDTH) for _ in range(4))
+    ex, ey = (ex % 5 + sx) % WIDTH, (ey % 5 + sy) % HEIGHT
+    args = (sx, sy, ex, ey, passable, cooldown, shelter, night,
+            rnd.randint(0, 40), 4, horizon, rnd.randint(0, 2), rnd.choice([0, 0, 6]))
+    move = finder.night_safe(*args)
+    expected = night_safe(*args)
+    if expected is None:
+        assert not move.path, (case, move)
+    else:
+        assert move.path and move.arrival == expected, (case, move.arrival, expected)
+        assert (move.path[0][1], move.path[0][2]) == (ex, ey) and (move.path[-1][1], move.path[-1][2]) == (sx, sy)
+        for a, b in zip(move.path, move.path[1:]):
+            assert abs(a[1] - b[1]) + abs(a[2] - b[2]) <= 1, (case, move.path)
+
+# is_night: the turns GameExtended.isNight plays as night
+game.turn = 0
+for turn in range(360):
+    game.turn, game.time = turn, turn % CYCLE_LENGTH
+    game.lux_time = max(0, NIGHT_START - game.time)
+    assert game.isNight() == is_night(turn) == (game.lux_time < 1), turn
+
+print("test_pathfinding ok")
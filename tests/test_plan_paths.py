@@ -0,0 +1,55 @@
+# used to test GameMap.plan_paths against Position.path_to of each unit, on
+# generated games (python tests/test_plan_paths.py)
+
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from lux.game import Game
+from lux.game_map import Position, GameMap
+from lux.array_map import ArrayGameMap
+from lux.pathfinding import get_path_finder
+
+rnd = random.Random(0)
+FLAGS = [{}, {"playerid": 0}, {"playerid": 1}, {"noCities": True}, {"noResources": True, "playerid": 0},
+         {"astar": True, "playerid": 0}, {"cooldown": 2, "playerid": 1}]
+
+checked = searches = 0
+for seed, map_class in [(0, GameMap), (1, ArrayGameMap)]:
+    observations = make_observations(seed=seed)
+    game = Game(incremental=True, map_class=map_class)
+    game._initialize(observations[0][:2])
+    game._update(observations[0][2:])
+    finder = get_path_finder(game.map_width, game.map_height)
+    for turn, updates in enumerate(observations[1:], 1):
+        game._update(updates)
+        if turn % 10:
+            continue
+        # the searches of the copy are its own
+        reference = game.map.copy()
+        targets = [Position.at(rnd.randrange(game.map_width), rnd.randrange(game.map_height)) for _ in range(3)]
+        requests = [(unit, rnd.choice(targets), rnd.choice(FLAGS)) for p in game.players for unit in p.units]
+        misses = finder.misses
+        batch = game.map.plan_paths(requests)
+        shared = [(target, tuple(sorted(flags.items()))) for _, target, flags in requests
+                  if not flags.get("astar") and flags.get("cooldown") is None]
+        groups = set(shared)
+        single = len(requests) - len(shared)
+        # one search for each target and flags, then A* and cooldown ones
+        assert finder.misses - misses == len(groups), (seed, turn)
+        assert batch.requests == len(requests) and batch.searches == len(groups) + single, (seed, turn)
+        for unit, target, flags in requests:
+            move = batch.moves[unit.id]
+            expected = unit.pos.path_to(target, reference, **flags)
+            assert move.path == expected.path and move.direction == expected.direction, (seed, turn, unit.id)
+        checked += len(requests)
+        searches += batch.searches
+
+# the units sharing a target and flags share a search
+assert searches < checked, (searches, checked)
+print("test_plan_paths ok")
@@ -0,0 +1,61 @@
+# used to test Position copies and pickling (python tests/test_position.py)
+
+import copy
+import os
+import pickle
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from lux.game import Game
+from lux.game_map import Position, GameMap
+from lux.array_map import ArrayGameMap
+from lux.game_objects import Unit, City
+from lux.constants import Constants
+
+UNIT_TYPES = Constants.UNIT_TYPES
+
+pos = Position.at(3, 4)
+far = Position(-1, 40)     # off the flyweight cache
+
+# copies of an immutable Position are the same instance
+assert copy.copy(pos) is pos
+assert copy.deepcopy(pos) is pos
+assert copy.deepcopy(far) is far
+
+# pickle round trip
+for p in (pos, far):
+    q = pickle.loads(pickle.dumps(p))
+    assert q == p and hash(q) == hash(p), (p, q)
+
+# objects holding positions
+unit = Unit(0, UNIT_TYPES.WORKER, "u_1", 3, 4, 0, 10, 0, 0)
+for u in (copy.deepcopy(unit), pickle.loads(pickle.dumps(unit))):
+    assert u.pos == unit.pos and u.id == unit.id and u.cargo.wood == 10
+
+city = City(0, "c_1", 100, 10)
+city._add_city_tile(3, 4, 0)
+for c in (copy.deepcopy(city), pickle.loads(pickle.dumps(city))):
+    assert c.citytiles[0].pos == pos and c.cityid == "c_1"
+
+# game states, with both map backends
+observations = make_observations(turns=30, seed=1)
+for map_class in (GameMap, ArrayGameMap):
+    game = Game(incremental=True, map_class=map_class, distances=True)
+    game._initialize(observations[0][:2])
+    game._update(observations[0][2:])
+    for updates in observations[1:]:
+        game._update(updates)
+    for g in (copy.deepcopy(game), pickle.loads(pickle.dumps(game))):
+        for y in range(game.map_height):
+            for x in range(game.map_width):
+                a, b = game.map.get_cell(x, y), g.map.get_cell(x, y)
+                assert a.pos == b.pos and a.has_resource() == b.has_resource(), (map_class, x, y)
+                assert (a.citytile is None) == (b.citytile is None), (map_class, x, y)
+        for p, q in zip(game.players, g.players):
+            assert [(u.id, u.pos) for u in p.units] == [(u.id, u.pos) for u in q.units], map_class
+
+print("test_position ok")
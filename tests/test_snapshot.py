@@ -0,0 +1,92 @@
+# used to test the copy-on-write snapshots of GameExtended: the updates and
+# the job changes of one game never show in the other one
+# (python tests/test_snapshot.py)
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from abn.game_ext import GameExtended
+from abn.jobs import Task
+from lux.game_map import Position
+from lux.spatial import FUEL_RATE
+
+PLAYER = 0
+SPLIT = 200     # turn of the snapshots
+
+
+class Observation(dict):
+    pass
+
+
+def play(game, observations, start):
+    observation = Observation()
+    observation.player = PLAYER
+    for step, updates in enumerate(observations, start):
+        observation["updates"] = updates
+        observation["step"] = step
+        game._update(observation)
+        game.energy_map, game.explore_index, game.free_cells     # layers computed and kept
+    return game
+
+
+def xy(pos):
+    return pos.x, pos.y
+
+
+def state(game):
+    """ Everything of the game an update or a job change can touch """
+    corner = Position.at(0, 0)
+    players = [(p.research_points,
+                sorted((u.id, xy(u.pos), u.cooldown, u.cargo.wood, u.cargo.coal, u.cargo.uranium) for u in p.units),
+                sorted((u.id, xy(u.pos)) for u in p.unit_by_id.values()),
+                sorted((cityid, c.fuel, c.light_upkeep, sorted((xy(ct.pos), ct.cooldown) for ct in c.citytiles))
+                       for cityid, c in p.cities.items()),
+                [(d, xy(ct.pos)) for d, ct in p.city_tile_index.k_nearest(corner, 1000)])
+               for p in game.players]
+    game_map = [array.tobytes() for array in game.map._arrays()]
+    resources = sorted(game.resources.cells(FUEL_RATE))
+    clusters = sorted((c.id, sorted(c.cells), c.fuel) for c in game.clusters)
+    board = game.job_board
+    jobs = [(job.task, xy(job.pos), job.unit_id, job.subtask, sorted(job.data.items()))
+            for job in board.todo + list(board.inprogress.values())]
+    layers = [sorted(game.energy_map.items()), game.explore_index._buckets, list(game.free_cells)]
+    return game.turn, players, game_map, resources, clusters, jobs, dict(board._active_pos), layers
+
+
+def change_jobs(game):
+    board = game.job_board
+    board.addJob(Task.BUILD, Position.at(1, 1))
+    board.addJob(Task.HARVEST, Position.at(3, 3))
+    job = board.todo[0]
+    job.pos = Position.at(2, 2)
+    job.data["changed"] = True
+    board.jobRequest(game.player.units[0])
+
+
+observations = make_observations(seed=3, player=PLAYER)
+game = play(GameExtended(), observations[:SPLIT], 0)
+later = play(GameExtended(), observations[:SPLIT + 60], 0)
+
+# the snapshot updated and its jobs changed: the game stays the same
+snapshot = game.snapshot()
+before = state(game)
+play(snapshot, observations[SPLIT:SPLIT + 60], SPLIT)
+assert state(snapshot) == state(later)
+change_jobs(snapshot)
+assert state(snapshot) != state(later)
+assert state(game) == before
+
+# the game updated and its jobs changed: the snapshot stays the same
+snapshot = game.snapshot()
+before = state(snapshot)
+play(game, observations[SPLIT:SPLIT + 60], SPLIT)
+assert state(game) == state(later)
+change_jobs(game)
+assert state(snapshot) == before
+
+print("test_snapshot ok")
@@ -0,0 +1,187 @@
+# used to test the incremental indexes of lux.spatial against plain searches
+# of the whole map, on random edits and generated games
+# (python tests/test_spatial.py)
+
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bots", "attila"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from bench import make_observations
+from lux.game import Game
+from lux.game_map import Position, GameMap, Cell, Resource
+from lux.array_map import ArrayGameMap
+from lux.spatial import ResourceIndex, ResourceClusters, FUEL_RATE, NEIGHBORS
+
+TYPES = tuple(FUEL_RATE)
+rnd = random.Random(0)
+
+
+###############################################################################
+# REFERENCE SEARCHES
+###############################################################################
+def resource_cells(game_map):
+    """ (x, y): (type, amount) of the cells with a resource """
+    cells = {}
+    for y in range(game_map.height):
+        for x in range(game_map.width):
+            resource = game_map.get_cell(x, y).resource
+            if resource is not None and resource.amount > 0:
+                cells[x, y] = (resource.type, resource.amount)
+    return cells
+
+
+def components(cells):
+    """ Connected regions (4-neighbors) of cells, as frozensets """
+    seen = set()
+    regions = []
+    for seed in cells:
+        if seed in seen:
+            continue
+        region = {seed}
+        stack = [seed]
+        while stack:
+            x, y = stack.pop()
+            for dx, dy in NEIGHBORS:
+                xy = (x + dx, y + dy)
+                if xy in cells and xy not in region:
+                    region.add(xy)
+                    stack.append(xy)
+        seen |= region
+        regions.append(frozenset(region))
+    return regions
+
+
+def distance(a, b):
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+###############################################################################
+
+
+def check_index(index, cells, width, height):
+    """ ResourceIndex: the cells of each type, the nearest ones """
+    for r_type in TYPES:
+        expected = sorted(xy for xy, (t, _) in cells.items() if t == r_type)
+        assert sorted(index.cells([r_type])) == expected, r_type
+    for _ in range(5):
+        pos = Position.at(rnd.randrange(width), rnd.randrange(height))
+        types = rnd.sample(TYPES, rnd.randint(1, 3))
+        found = index.k_nearest(pos, 4, types)
+        expected = sorted(distance((pos.x, pos.y), xy) for xy, (t, _) in cells.items() if t in types)[:4]
+        assert [d for d, _ in found] == expected, (found, expected)
+
+
+def check_clusters(clusters, cells, width, height):
+    """ ResourceClusters: the regions of a full labeling, with their aggregates """
+    regions = components(cells)
+    assert sorted(map(sorted, regions)) == sorted(sorted(c.cells) for c in clusters)
+    for cluster in clusters:
+        type_fuel = dict.fromkeys(FUEL_RATE, 0)
+        for xy in cluster.cells:
+            r_type, amount = cells[xy]
+            type_fuel[r_type] += amount * FUEL_RATE[r_type]
+            assert clusters.cluster_at(*xy) is cluster, xy
+        assert cluster.type_fuel == type_fuel and cluster.fuel == sum(type_fuel.values()), cluster.id
+        perimeter = {(x + dx, y + dy) for x, y in cluster.cells for dx, dy in NEIGHBORS
+                     if 0 <= x + dx < width and 0 <= y + dy < height} - cluster.cells
+        assert cluster.perimeter == perimeter, cluster.id
+        xs, ys = zip(*cluster.cells)
+        assert cluster.bbox == (min(xs), min(ys), max(xs), max(ys)), cluster.id
+    for y in range(height):
+        for x in range(width):
+            around = [c for c in clusters if (x, y) in c.perimeter]
+            assert clusters.clusters_around(x, y) == sorted(around, key=lambda c: c.id), (x, y)
+
+    # count_workers: each position counts once, for its cluster or the
+    # lowest id around it
+    positions = [Position.at(rnd.randrange(width), rnd.randrange(height)) for _ in range(30)]
+    expected = dict.fromkeys(clusters.clusters, 0)
+    for pos in positions:
+        cluster = clusters.cluster_at(pos.x, pos.y)
+        around = clusters.clusters_around(pos.x, pos.y)
+        if cluster is not None:
+            expected[cluster.id] += 1
+        elif around:
+            expected[around[0].id] += 1
+    assert clusters.count_workers(positions) == expected
+
+
+class EditedMap:
+    """ Map of random resource edits, with the dirty cells of the last edits """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cells = {}     # (x, y): Cell
+        self.dirty = set()
+
+    def get_cell(self, x, y):
+        return self.cells.setdefault((x, y), Cell(x, y))
+
+    def edit(self, n):
+        self.dirty = set()
+        for _ in range(n):
+            x, y = rnd.randrange(self.width), rnd.randrange(self.height)
+            cell = self.get_cell(x, y)
+            if cell.resource is None or rnd.random() < 0.3:
+                cell.resource = Resource(rnd.choice(TYPES), rnd.randint(1, 500))
+            elif rnd.random() < 0.5:
+                cell.resource.amount = rnd.randint(0, 500)     # amount 0 is no resource
+            else:
+                cell.resource = None
+            self.dirty.add((x, y))
+
+
+# random edits: cells added and removed split and merge the clusters
+for case in range(10):
+    edited = EditedMap(12, 12)
+    index = ResourceIndex(edited.width, edited.height)
+    clusters = ResourceClusters(edited.width, edited.height)
+    for _ in range(60):
+        edited.edit(rnd.randint(1, 8))
+        index.update(edited)
+        clusters.update(edited)
+        cells = resource_cells(edited)
+        check_index(index, cells, edited.width, edited.height)
+        check_clusters(clusters, cells, edited.width, edited.height)
+    assert clusters.updates > 60, clusters.updates
+
+# generated games
+checked = 0
+for seed, map_class in [(0, GameMap), (1, ArrayGameMap), (2, ArrayGameMap)]:
+    observations = make_observations(seed=seed)
+    game = Game(incremental=True, map_class=map_class)
+    index = clusters = None
+    for turn, updates in enumerate(observations):
+        if turn == 0:
+            game._initialize(updates[:2])
+            game._update(updates[2:])
+            index = ResourceIndex(game.map_width, game.map_height)
+            clusters = ResourceClusters(game.map_width, game.map_height)
+        else:
+            game._update(updates)
+        index.update(game.map)
+        clusters.update(game.map)
+        if turn % 7:
+            continue
+        checked += 1
+        cells = resource_cells(game.map)
+        check_index(index, cells, game.map_width, game.map_height)
+        check_clusters(clusters, cells, game.map_width, game.map_height)
+
+        # CityTileIndex: the nearest citytile of each player
+        for player in game.players:
+            tiles = [(ct.pos.x, ct.pos.y) for city in player.cities.values() for ct in city.citytiles]
+            assert len(player.city_tile_index) == len(tiles), (seed, turn)
+            for _ in range(5):
+                pos = Position.at(rnd.randrange(game.map_width), rnd.randrange(game.map_height))
+                citytile = player.city_tile_index.nearest(pos)
+                if not tiles:
+                    assert citytile is None
+                    continue
+                assert distance((pos.x, pos.y), (citytile.pos.x, citytile.pos.y)) == \
+                    min(distance((pos.x, pos.y), xy) for xy in tiles), (seed, turn)
+
+assert checked
+print("test_spatial ok")